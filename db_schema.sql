@@ -14,6 +14,7 @@ CREATE TABLE IF NOT EXISTS nodes (
 -- Containers table to track running containers
 CREATE TABLE IF NOT EXISTS containers (
     id TEXT PRIMARY KEY,
+    name TEXT,
     service_id TEXT,
     node_id TEXT,
     image TEXT NOT NULL,
@@ -24,6 +25,8 @@ CREATE TABLE IF NOT EXISTS containers (
     started_at TIMESTAMP,
     finished_at TIMESTAMP,
     ports TEXT,
+    restart_count INTEGER DEFAULT 0,
+    exit_code INTEGER,
     last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (node_id) REFERENCES nodes(id)
 );
@@ -34,6 +37,7 @@ CREATE TABLE IF NOT EXISTS services (
     name TEXT NOT NULL,
     image TEXT NOT NULL,
     replicas INTEGER NOT NULL,
+    desired_replicas INTEGER DEFAULT 0,
     status TEXT NOT NULL,
     created_at TIMESTAMP NOT NULL,
     updated_at TIMESTAMP NOT NULL,
@@ -66,4 +70,174 @@ CREATE TABLE IF NOT EXISTS events (
 CREATE INDEX IF NOT EXISTS idx_containers_node ON containers(node_id);
 CREATE INDEX IF NOT EXISTS idx_containers_service ON containers(service_id);
 CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type);
-CREATE INDEX IF NOT EXISTS idx_events_object ON events(object_type, object_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_events_object ON events(object_type, object_id);
+
+-- Historical state tracking
+
+-- Append-only log of state transitions (node status, replica counts, container state)
+CREATE TABLE IF NOT EXISTS state_transitions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts INTEGER NOT NULL,
+    object_type TEXT NOT NULL,
+    object_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    old_value TEXT,
+    new_value TEXT
+);
+
+-- Series dictionary so sample rows only carry a small integer key
+CREATE TABLE IF NOT EXISTS history_series (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    object_type TEXT NOT NULL,
+    object_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    UNIQUE (object_type, object_id, metric)
+);
+
+-- Raw samples, one row per series per collector pass
+CREATE TABLE IF NOT EXISTS history_raw (
+    series_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (series_id, ts)
+) WITHOUT ROWID;
+
+-- 1-minute rollups of history_raw
+CREATE TABLE IF NOT EXISTS history_1m (
+    series_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (series_id, bucket)
+) WITHOUT ROWID;
+
+-- 1-hour rollups of history_1m
+CREATE TABLE IF NOT EXISTS history_1h (
+    series_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (series_id, bucket)
+) WITHOUT ROWID;
+
+-- Rollup checkpoints: the first bucket of each tier that has not been rolled up yet
+CREATE TABLE IF NOT EXISTS history_rollup_state (
+    tier TEXT PRIMARY KEY,
+    next_bucket INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_transitions_object ON state_transitions(object_type, object_id, ts);
+CREATE INDEX IF NOT EXISTS idx_transitions_ts ON state_transitions(ts);
+CREATE INDEX IF NOT EXISTS idx_history_raw_ts ON history_raw(ts);
+CREATE INDEX IF NOT EXISTS idx_history_1m_bucket ON history_1m(bucket);
+CREATE INDEX IF NOT EXISTS idx_history_1h_bucket ON history_1h(bucket);
+
+
+-- Health rollups, refreshed once per pass by the tasks collector in the same transaction as its upserts
+
+-- Per-service replica counts and health verdict
+CREATE TABLE IF NOT EXISTS service_summary (
+    service_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    desired_replicas INTEGER NOT NULL,
+    running_replicas INTEGER NOT NULL,
+    containers_running INTEGER NOT NULL,
+    containers_stopped INTEGER NOT NULL,
+    containers_failed INTEGER NOT NULL,
+    restarts INTEGER NOT NULL,
+    health TEXT NOT NULL,
+    last_change INTEGER NOT NULL,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-node container counts and health verdict
+CREATE TABLE IF NOT EXISTS node_summary (
+    node_id TEXT PRIMARY KEY,
+    hostname TEXT NOT NULL,
+    status TEXT NOT NULL,
+    availability TEXT NOT NULL,
+    containers_running INTEGER NOT NULL,
+    containers_stopped INTEGER NOT NULL,
+    containers_failed INTEGER NOT NULL,
+    restarts INTEGER NOT NULL,
+    health TEXT NOT NULL,
+    last_change INTEGER NOT NULL,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Last successful collector sync per resource, used to report staleness after a restart
+CREATE TABLE IF NOT EXISTS sync_state (
+    resource TEXT PRIMARY KEY,
+    as_of INTEGER
+);
+
+-- Normalized hash of each stack's last deployed compose file and image digests
+CREATE TABLE IF NOT EXISTS stack_deployments (
+    stack_name TEXT PRIMARY KEY,
+    compose_hash TEXT NOT NULL,
+    compose_json TEXT NOT NULL,
+    image_digests TEXT NOT NULL,
+    deployed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Image pre-distribution runs and their per-node progress
+CREATE TABLE IF NOT EXISTS image_prepulls (
+    id TEXT PRIMARY KEY,
+    image TEXT NOT NULL,
+    digest TEXT,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS image_prepull_nodes (
+    prepull_id TEXT NOT NULL,
+    node_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (prepull_id, node_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_prepulls_digest ON image_prepulls(digest);
+
+-- Latest status and capacity of each GlusterFS brick
+CREATE TABLE IF NOT EXISTS gluster_bricks (
+    brick TEXT PRIMARY KEY,
+    volume TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    path TEXT NOT NULL,
+    online INTEGER NOT NULL,
+    pid INTEGER,
+    port INTEGER,
+    size_total INTEGER,
+    size_free INTEGER,
+    inodes_total INTEGER,
+    inodes_free INTEGER,
+    device TEXT,
+    fs_name TEXT,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Swarm tasks on every node, including retained history; source of the health rollups
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    service_id TEXT,
+    node_id TEXT,
+    image TEXT,
+    desired_state TEXT,
+    current_state TEXT,
+    state TEXT,
+    state_age INTEGER,
+    error TEXT,
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_tasks_service ON tasks(service_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_node ON tasks(node_id);
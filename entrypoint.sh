@@ -7,6 +7,7 @@ TOKEN_SERVICE_PORT=${TOKEN_SERVICE_PORT:-8000}
 ADMIN_KEY_FILE="/tokens/admin.key"
 REGISTRY_HOST=${REGISTRY_HOST:-"127.0.0.1"}
 REGISTRY_PORT=${REGISTRY_PORT:-5000}
+REGISTRY_DEBUG_PORT=${REGISTRY_DEBUG_PORT:-5001}
 GLUSTER_VOLUME_NAME=${GLUSTER_VOLUME_NAME:-"docker-volume"}
 GLUSTER_BRICK_PATH=${GLUSTER_BRICK_PATH:-"/gluster/bricks"}
 MONITOR_PORT=${MONITOR_PORT:-8001}
@@ -14,6 +15,21 @@ DB_PATH="/data/swarm_monitor.db"
 
 echo "Starting Docker Swarm Management Node"
 
+# Setup SQLite database
+echo "Setting up SQLite database..."
+if [ ! -f "$DB_PATH" ]; then
+    echo "Creating new database at $DB_PATH"
+    sqlite3 "$DB_PATH" < /app/db_schema.sql
+    echo "Database created successfully!"
+else
+    echo "Database already exists at $DB_PATH"
+fi
+
+# Start monitoring service first: it serves the persisted state (flagged as stale)
+# while Docker, GlusterFS and the registry come up, and reconciles in the background
+echo "Starting container monitoring service on port $MONITOR_PORT..."
+python3 /app/swarm_monitor.py &
+
 # Start Docker daemon
 echo "Starting Docker daemon..."
 dockerd-entrypoint.sh &
@@ -36,26 +52,24 @@ else
     echo "Swarm already initialized."
 fi
 
-# Setup SQLite database
-echo "Setting up SQLite database..."
-if [ ! -f "$DB_PATH" ]; then
-    echo "Creating new database at $DB_PATH"
-    sqlite3 "$DB_PATH" < /app/db_schema.sql
-    echo "Database created successfully!"
-else
-    echo "Database already exists at $DB_PATH"
-fi
-
 # Setup GlusterFS
 echo "Setting up GlusterFS..."
 /app/gluster-setup.sh
 
 # Setup Docker Registry
 echo "Setting up local Docker Registry..."
+# A registry whose debug (metrics) port isn't published on loopback only has to be recreated;
+# the debug server also exposes pprof and expvar, and the monitor scrapes it over 127.0.0.1
+if docker ps -a --format '{{.Names}}' | grep -qx registry && \
+   [ "$(docker port registry 5001 2>/dev/null)" != "127.0.0.1:${REGISTRY_DEBUG_PORT}" ]; then
+    echo "Recreating Docker Registry to publish its metrics port on 127.0.0.1..."
+    docker rm -f registry
+fi
 if ! docker ps | grep -q registry; then
     echo "Starting Docker Registry on port $REGISTRY_PORT..."
     docker run -d \
       -p ${REGISTRY_PORT}:5000 \
+      -p 127.0.0.1:${REGISTRY_DEBUG_PORT}:5001 \
       --restart=always \
       --name registry \
       -v /var/lib/registry:/var/lib/registry \
@@ -91,10 +105,6 @@ fi
 echo "Starting token authentication service on port $TOKEN_SERVICE_PORT..."
 python3 /app/token_service.py &
 
-# Start monitoring service
-echo "Starting container monitoring service on port $MONITOR_PORT..."
-python3 /app/swarm_monitor.py &
-
 # Display connection info
 MANAGER_IP=$(hostname -i)
 echo "=========================================="
@@ -1,16 +1,24 @@
+import time
+START_TIME = time.time()  # Taken before the imports below so time-to-first-response covers them
+
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import sqlite3
 import json
 import subprocess
 import threading
-import time
 import os
 import uuid
 import tempfile
 import shutil
 import datetime
-import werkzeug.utils
+import heapq
+import bisect
+import hashlib
+import re
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from array import array
 
 # Configuration
 DB_PATH = "/data/swarm_monitor.db"
@@ -18,6 +26,42 @@ UPLOAD_FOLDER = "/data/uploads"
 REGISTRY_HOST = os.environ.get("REGISTRY_HOST", "127.0.0.1")
 REGISTRY_PORT = os.environ.get("REGISTRY_PORT", "5000")
 MONITOR_PORT = int(os.environ.get("MONITOR_PORT", "8001"))
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_schema.sql")
+
+# History retention per tier, in seconds
+HISTORY_RAW_RETENTION = int(os.environ.get("HISTORY_RAW_RETENTION", str(24 * 3600)))
+HISTORY_1M_RETENTION = int(os.environ.get("HISTORY_1M_RETENTION", str(7 * 24 * 3600)))
+HISTORY_1H_RETENTION = int(os.environ.get("HISTORY_1H_RETENTION", str(180 * 24 * 3600)))
+
+# Tasks that failed within this many seconds make a node or service "failing"
+SUMMARY_FAILED_WINDOW = int(os.environ.get("SUMMARY_FAILED_WINDOW", "900"))
+
+# Container resource metrics
+DOCKER_SOCKET = os.environ.get("DOCKER_SOCKET", "/var/run/docker.sock")
+METRICS_RING_SIZE = int(os.environ.get("METRICS_RING_SIZE", "120"))
+METRICS_MAX_STREAMS = int(os.environ.get("METRICS_MAX_STREAMS", "256"))
+METRICS_FLUSH_INTERVAL = int(os.environ.get("METRICS_FLUSH_INTERVAL", "60"))
+
+# Upper bound on concurrent `docker stack deploy` runs for batch deploys
+DEPLOY_MAX_PARALLEL = int(os.environ.get("DEPLOY_MAX_PARALLEL", "4"))
+
+# Image pre-distribution after upload
+PREPULL_MAX_PARALLEL = int(os.environ.get("PREPULL_MAX_PARALLEL", "4"))
+PREPULL_TIMEOUT = int(os.environ.get("PREPULL_TIMEOUT", "600"))
+# Seconds a node warmed by an earlier prepull is trusted to still hold the image
+PREPULL_SKIP_MAX_AGE = int(os.environ.get("PREPULL_SKIP_MAX_AGE", "86400"))
+
+# Registry debug listener (see registry-config.yml) exposing Prometheus metrics; published on loopback only
+REGISTRY_DEBUG_PORT = os.environ.get("REGISTRY_DEBUG_PORT", "5001")
+REGISTRY_METRICS_URL = f"http://127.0.0.1:{REGISTRY_DEBUG_PORT}/metrics"
+REGISTRY_SCRAPE_INTERVAL = int(os.environ.get("REGISTRY_SCRAPE_INTERVAL", "30"))
+REGISTRY_SCRAPE_TIMEOUT = int(os.environ.get("REGISTRY_SCRAPE_TIMEOUT", "10"))
+
+# GlusterFS volume collector (volume created by gluster-setup.sh)
+GLUSTER_VOLUME_NAME = os.environ.get("GLUSTER_VOLUME_NAME", "docker-volume")
+GLUSTER_SCRAPE_INTERVAL = int(os.environ.get("GLUSTER_SCRAPE_INTERVAL", "60"))
+GLUSTER_PROFILE = os.environ.get("GLUSTER_PROFILE", "true").lower() == "true"
+GLUSTER_TOP_COUNT = int(os.environ.get("GLUSTER_TOP_COUNT", "10"))
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -28,12 +72,56 @@ CORS(app)  # Enable CORS for all routes
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # Limit uploads to 500MB
 
+# Connection that only publishes history series ids it created once they are committed
+class MonitorConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_series = {}
+    
+    def commit(self):
+        super().commit()
+        if self.pending_series:
+            with SERIES_LOCK:
+                SERIES_IDS.update(self.pending_series)
+            self.pending_series.clear()
+    
+    def rollback(self):
+        super().rollback()
+        self.pending_series.clear()
+
 # Database connection helper
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    # WAL plus a busy timeout: the collector, flush, scrape and prepull threads all write concurrently
+    conn = sqlite3.connect(DB_PATH, timeout=30, factory=MonitorConnection)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA busy_timeout=30000')
     return conn
 
+# Columns added after the original schema; CREATE TABLE IF NOT EXISTS won't add them to old databases
+SCHEMA_MIGRATIONS = [
+    ('containers', 'restart_count', 'INTEGER DEFAULT 0'),
+    ('containers', 'exit_code', 'INTEGER'),
+    ('services', 'desired_replicas', 'INTEGER DEFAULT 0'),
+    ('containers', 'name', 'TEXT'),
+]
+
+# Apply the schema (all statements are idempotent) so new tables exist on old databases
+def init_db():
+    conn = get_db_connection()
+    try:
+        with open(SCHEMA_PATH) as f:
+            conn.executescript(f.read())
+        
+        for table, column, declaration in SCHEMA_MIGRATIONS:
+            columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+            if column not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+        
+        conn.commit()
+    finally:
+        conn.close()
+
 # Execute Docker command and return JSON result
 def execute_docker_cmd(cmd):
     try:
@@ -58,30 +146,174 @@ def log_event(event_type, object_type, object_id, details=None):
     finally:
         conn.close()
 
+# Seconds between collector passes
+SYNC_INTERVAL = 30
+
+# Collectors only inspect new or changed objects; every object is re-inspected this often
+FULL_SYNC_INTERVAL = int(os.environ.get("FULL_SYNC_INTERVAL", "600"))
+
+# Objects per batched `docker ... inspect` call
+INSPECT_BATCH_SIZE = 100
+
+# Per-resource sync state: as_of is the last successful sync (epoch seconds, persisted),
+# running is live, reconciled turns true after the first successful sync since startup
+SYNC_STATE = {}
+SYNC_LOCK = threading.Lock()
+
+# The first sync after startup is a full one
+def new_sync_state(as_of=None):
+    return {'as_of': as_of, 'running': False, 'reconciled': False, 'last_full': 0}
+
+# A resource is reported as syncing until it has been reconciled since startup
+def sync_metadata(state):
+    return {
+        'as_of': state['as_of'],
+        'syncing': state['running'] or not state['reconciled'],
+    }
+
+# Load the persisted sync checkpoints so the API can report staleness before the first pass
+def load_sync_state():
+    conn = get_db_connection()
+    try:
+        rows = {row['resource']: row['as_of'] for row in conn.execute('SELECT * FROM sync_state')}
+    finally:
+        conn.close()
+    
+    with SYNC_LOCK:
+        for resource in SYNC_RESOURCES:
+            SYNC_STATE[resource] = new_sync_state(rows.get(resource))
+
+# Run one collector and advance its checkpoint if it reached Docker.
+# Collectors diff Docker's listing against the persisted rows and only inspect what changed,
+# unless a full pass is forced or FULL_SYNC_INTERVAL has elapsed.
+def sync_resource(resource, full=None):
+    with SYNC_LOCK:
+        state = SYNC_STATE.setdefault(resource, new_sync_state())
+        state['running'] = True
+        if full is None:
+            full = time.time() - state['last_full'] >= FULL_SYNC_INTERVAL
+    try:
+        if not SYNC_RESOURCES[resource](full=full):
+            return False
+        
+        as_of = int(time.time())
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO sync_state (resource, as_of) VALUES (?, ?)',
+                (resource, as_of)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        with SYNC_LOCK:
+            SYNC_STATE[resource]['as_of'] = as_of
+            SYNC_STATE[resource]['reconciled'] = True
+            if full:
+                SYNC_STATE[resource]['last_full'] = time.time()
+        return True
+    finally:
+        with SYNC_LOCK:
+            SYNC_STATE[resource]['running'] = False
+
+# Reconcile stalest resources first, skipping ones synced within half an interval (e.g. just before a restart)
+def reconcile():
+    with SYNC_LOCK:
+        as_of = {resource: (SYNC_STATE.get(resource) or {}).get('as_of') or 0 for resource in SYNC_RESOURCES}
+    
+    now = time.time()
+    for resource in sorted(SYNC_RESOURCES, key=lambda r: as_of[r]):
+        if now - as_of[resource] < SYNC_INTERVAL / 2:
+            # Synced moments before a restart: the persisted rows are current
+            with SYNC_LOCK:
+                SYNC_STATE[resource]['reconciled'] = True
+            continue
+        try:
+            sync_resource(resource)
+        except Exception as e:
+            print(f"Error syncing {resource}: {e}")
+    
+    sync_stats_streams()
+    rollup_history()
+
 # Background worker to update database with current state
 def update_data_worker():
+    # Built here rather than before app.run so the API answers from SQLite immediately
+    load_id_index()
+    
     while True:
         try:
-            update_nodes()
-            update_services()
-            update_containers()
-            update_images()
+            reconcile()
         except Exception as e:
             print(f"Error in update worker: {e}")
         
         # Sleep for 30 seconds before next update
-        time.sleep(30)
+        time.sleep(SYNC_INTERVAL)
+
+# Inspect many objects with one `docker ... inspect` call per batch: {requested id: document}
+def inspect_objects(command, object_ids):
+    results = {}
+    for start in range(0, len(object_ids), INSPECT_BATCH_SIZE):
+        batch = object_ids[start:start + INSPECT_BATCH_SIZE]
+        output = execute_docker_cmd(f"{command} {' '.join(batch)}")
+        if output is None and len(batch) > 1:
+            # One object vanishing between ls and inspect fails the whole call
+            for object_id in batch:
+                results.update(inspect_objects(command, [object_id]))
+            continue
+        try:
+            documents = json.loads(output) if output else []
+        except json.JSONDecodeError:
+            continue
+        
+        # Listings may use short IDs while inspect reports full ones
+        for document in documents:
+            full_id = document.get('ID') or document.get('Id') or ''
+            for object_id in batch:
+                if full_id.startswith(object_id):
+                    results[object_id] = document
+    return results
+
+# Persisted rows keyed by id, used to skip inspecting unchanged objects
+def load_rows(table, columns):
+    conn = get_db_connection()
+    try:
+        return {row['id']: row for row in conn.execute(f"SELECT id, {columns} FROM {table}")}
+    finally:
+        conn.close()
+
+# Delete rows for objects missing from Docker's full listing
+def prune_rows(conn, table, listed_ids):
+    conn.execute(f"DELETE FROM {table} WHERE id NOT IN ({','.join('?' * len(listed_ids))})", listed_ids)
 
 # Update nodes information
-def update_nodes():
+def update_nodes(full=True):
     nodes_json = execute_docker_cmd("docker node ls --format '{{json .}}'")
-    if not nodes_json:
-        return
+    if nodes_json is None:
+        return False
+    
+    # Split multiple JSON objects if needed
+    nodes = [json.loads(node) for node in nodes_json.strip().split('\n') if node]
+    
+    # Inspect new or changed nodes (all of them on a full pass), before opening the write transaction
+    existing = load_rows('nodes', 'ip_address, status, availability')
+    changed = [node.get('ID', '') for node in nodes
+               if full or node.get('ID') not in existing
+               or not existing[node['ID']]['ip_address']
+               or existing[node['ID']]['status'] != node.get('Status', '')
+               or existing[node['ID']]['availability'] != node.get('Availability', '')]
+    inspected = inspect_objects('docker node inspect', changed)
+    for node in nodes:
+        if node.get('ID') in inspected:
+            node['ip_address'] = (inspected[node['ID']].get('Status') or {}).get('Addr', '')
+        elif node.get('ID') in existing:
+            node['ip_address'] = existing[node['ID']]['ip_address']
+        else:
+            node['ip_address'] = ""
     
     conn = get_db_connection()
     try:
-        # Split multiple JSON objects if needed
-        nodes = [json.loads(node) for node in nodes_json.strip().split('\n') if node]
+        now = int(time.time())
         
         for node in nodes:
             node_id = node.get('ID', '')
@@ -89,12 +321,18 @@ def update_nodes():
             role = 'manager' if 'Leader' in node.get('ManagerStatus', '') else 'worker'
             status = node.get('Status', '')
             availability = node.get('Availability', '')
+            ip_address = node['ip_address']
             
-            # Get IP address from node inspect
-            ip_address = ""
-            node_inspect = execute_docker_cmd(f"docker node inspect {node_id} --format '{{{{.Status.Addr}}}}'")
-            if node_inspect:
-                ip_address = node_inspect
+            # Record status/availability changes and samples for history
+            previous = conn.execute(
+                'SELECT status, availability FROM nodes WHERE id = ?', (node_id,)
+            ).fetchone()
+            track_state(conn, now, 'node', node_id, previous,
+                        {'status': status, 'availability': availability})
+            record_sample(conn, now, 'node', node_id, 'ready',
+                          1 if status.lower() == 'ready' else 0)
+            record_sample(conn, now, 'node', node_id, 'active',
+                          1 if availability.lower() == 'active' else 0)
             
             conn.execute(
                 """INSERT OR REPLACE INTO nodes 
@@ -103,20 +341,51 @@ def update_nodes():
                 (node_id, hostname, ip_address, role, status, availability)
             )
         
+        # Nodes removed from the swarm would otherwise break `docker node ps` in update_tasks
+        prune_rows(conn, 'nodes', [node.get('ID', '') for node in nodes])
         conn.commit()
+        refresh_id_index(conn, 'node')
     finally:
         conn.close()
+    return True
 
 # Update services information
-def update_services():
+def update_services(full=True):
     services_json = execute_docker_cmd("docker service ls --format '{{json .}}'")
-    if not services_json:
-        return
+    if services_json is None:
+        return False
+    
+    # Split multiple JSON objects if needed
+    services = [json.loads(service) for service in services_json.strip().split('\n') if service]
+    
+    # Get timestamps from service inspect for new services or ones whose image or replicas changed
+    # (all of them on a full pass), before opening the write transaction
+    existing = load_rows('services', 'image, replicas, desired_replicas, created_at, updated_at')
+    
+    def unchanged(service):
+        row = existing.get(service.get('ID'))
+        replicas_str = service.get('Replicas', '0/0')
+        return (row is not None and row['image'] == service.get('Image', '')
+                and str(row['replicas']) == replicas_str.split('/')[0]
+                and row['desired_replicas'] == parse_desired_replicas(replicas_str))
+    
+    changed = [service.get('ID', '') for service in services if full or not unchanged(service)]
+    inspected = inspect_objects('docker service inspect', changed)
+    for service in services:
+        created_at = datetime.datetime.now().isoformat()
+        updated_at = created_at
+        if service.get('ID') in inspected:
+            created_at = inspected[service['ID']].get('CreatedAt', created_at)
+            updated_at = inspected[service['ID']].get('UpdatedAt', updated_at)
+        elif service.get('ID') in existing:
+            created_at = existing[service['ID']]['created_at']
+            updated_at = existing[service['ID']]['updated_at']
+        service['created_at'] = created_at
+        service['updated_at'] = updated_at
     
     conn = get_db_connection()
     try:
-        # Split multiple JSON objects if needed
-        services = [json.loads(service) for service in services_json.strip().split('\n') if service]
+        now = int(time.time())
         
         for service in services:
             service_id = service.get('ID', '')
@@ -124,134 +393,1562 @@ def update_services():
             image = service.get('Image', '')
             replicas_str = service.get('Replicas', '0/0')
             replicas = int(replicas_str.split('/')[0]) if '/' in replicas_str else 0
+            desired = parse_desired_replicas(replicas_str)
             status = 'active' if replicas > 0 else 'inactive'
+            created_at = service['created_at']
+            updated_at = service['updated_at']
             
-            # Get timestamps from service inspect
-            created_at = datetime.datetime.now().isoformat()
-            updated_at = created_at
+            # Record replica changes and samples for history
+            previous = conn.execute(
+                'SELECT replicas, status FROM services WHERE id = ?', (service_id,)
+            ).fetchone()
+            track_state(conn, now, 'service', service_id, previous,
+                        {'replicas': replicas, 'status': status})
+            record_sample(conn, now, 'service', service_id, 'replicas_running', replicas)
+            record_sample(conn, now, 'service', service_id, 'replicas_desired', desired)
+            
+            conn.execute(
+                """INSERT OR REPLACE INTO services 
+                   (id, name, image, replicas, desired_replicas, status, created_at, updated_at, last_updated) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                (service_id, name, image, replicas, desired, status, created_at, updated_at)
+            )
+        
+        # Removed services (including finished prepull jobs) drop out of the summaries
+        prune_rows(conn, 'services', [service.get('ID', '') for service in services])
+        conn.commit()
+        refresh_id_index(conn, 'service')
+    finally:
+        conn.close()
+    return True
+
+# Update containers information
+def update_containers(full=True):
+    containers_json = execute_docker_cmd("docker ps -a --format '{{json .}}'")
+    if containers_json is None:
+        return False
+    
+    # Split multiple JSON objects if needed
+    containers = [json.loads(container) for container in containers_json.strip().split('\n') if container]
+    
+    # Inspect new containers and ones whose state changed (all of them on a full pass)
+    # before opening the write transaction; unchanged ones keep their persisted inspect fields
+    existing = load_rows('containers', 'state, service_id, node_id, started_at, finished_at, '
+                                       'restart_count, exit_code')
+    
+    def listed_state(container):
+        return 'running' if container.get('Status', '').lower().startswith('up') else 'stopped'
+    
+    changed = set(container.get('ID', '') for container in containers
+                  if full or container.get('ID') not in existing
+                  or existing[container['ID']]['state'] != listed_state(container))
+    inspected = inspect_objects('docker inspect', sorted(changed))
+    for container in containers:
+        container_id = container.get('ID')
+        inspect_data = inspected.get(container_id)
+        if inspect_data:
+            # Swarm task containers carry their placement in labels
+            labels = (inspect_data.get('Config') or {}).get('Labels') or {}
+            state_data = inspect_data.get('State', {})
+            # `docker service ls` (and so services.id) uses the 12-character short ID
+            service_id = inspect_data.get('Service', {}).get('ID', None) or labels.get('com.docker.swarm.service.id')
+            container['inspect'] = {
+                'node_id': inspect_data.get('Node', {}).get('ID', None) or labels.get('com.docker.swarm.node.id'),
+                'service_id': service_id[:12] if service_id else None,
+                'restart_count': inspect_data.get('RestartCount', 0),
+                'started_at': state_data.get('StartedAt', None),
+                'finished_at': state_data.get('FinishedAt', None),
+                'exit_code': state_data.get('ExitCode', None),
+            }
+        elif container_id in existing and container_id not in changed:
+            container['inspect'] = {key: existing[container_id][key] for key in
+                                    ('node_id', 'service_id', 'restart_count',
+                                     'started_at', 'finished_at', 'exit_code')}
+        else:
+            container['inspect'] = None
+    
+    conn = get_db_connection()
+    try:
+        now = int(time.time())
+        
+        for container in containers:
+            inspect_data = container['inspect']
+            if not inspect_data:
+                continue
+            
+            container_id = container.get('ID', '')
+            image = container.get('Image', '')
+            command = container.get('Command', '')
+            status = container.get('Status', '')
+            state = 'running' if status.lower().startswith('up') else 'stopped'
+            created_at = container.get('CreatedAt', datetime.datetime.now().isoformat())
+            ports = container.get('Ports', '')
+            name = container.get('Names', '')
+            
+            # Placement and timestamps from inspect (or the persisted row if unchanged)
+            node_id = inspect_data['node_id']
+            service_id = inspect_data['service_id']
+            restart_count = inspect_data['restart_count']
+            started_at = inspect_data['started_at']
+            finished_at = inspect_data['finished_at']
+            exit_code = inspect_data['exit_code']
+            
+            # Record state changes and samples for history
+            previous = conn.execute(
+                'SELECT state FROM containers WHERE id = ?', (container_id,)
+            ).fetchone()
+            track_state(conn, now, 'container', container_id, previous,
+                        {'state': state})
+            record_sample(conn, now, 'container', container_id, 'running',
+                          1 if state == 'running' else 0)
+            
+            conn.execute(
+                """INSERT OR REPLACE INTO containers 
+                   (id, name, service_id, node_id, image, command, status, state, 
+                    created_at, started_at, finished_at, ports, restart_count, 
+                    exit_code, last_updated) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                (container_id, name, service_id, node_id, image, command, status, 
+                 state, created_at, started_at, finished_at, ports, 
+                 restart_count, exit_code)
+            )
+        
+        # Removed containers would otherwise keep a stats stream (and a METRICS_MAX_STREAMS slot)
+        prune_rows(conn, 'containers', [container.get('ID', '') for container in containers])
+        conn.commit()
+        refresh_id_index(conn, 'container')
+    finally:
+        conn.close()
+    return True
+
+# Approximate age in seconds from a task state like "Failed 3 minutes ago" or "Running about an hour ago"
+TASK_AGE_RE = re.compile(r'(\d+|an?)\s+(second|minute|hour|day|week|month|year)s?\s+ago')
+TASK_AGE_UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400,
+                  'week': 7 * 86400, 'month': 30 * 86400, 'year': 365 * 86400}
+
+def parse_task_age(current_state):
+    match = TASK_AGE_RE.search(current_state)
+    if not match:
+        return None
+    count = 1 if match.group(1) in ('a', 'an') else int(match.group(1))
+    return count * TASK_AGE_UNITS[match.group(2)]
+
+# Update swarm task information for every node (includes the retained task history)
+def update_tasks(full=True):
+    conn = get_db_connection()
+    try:
+        nodes = {row['id']: row['hostname'] for row in conn.execute('SELECT id, hostname FROM nodes')}
+        services = {row['name']: row['id'] for row in conn.execute('SELECT id, name FROM services')}
+    finally:
+        conn.close()
+    if not nodes:
+        return True
+    
+    tasks_json = execute_docker_cmd(f"docker node ps {' '.join(nodes)} --format '{{{{json .}}}}'")
+    if tasks_json is None:
+        return False
+    
+    node_ids = {hostname: node_id for node_id, hostname in nodes.items()}
+    conn = get_db_connection()
+    try:
+        now = int(time.time())
+        conn.execute('DELETE FROM tasks')
+        
+        for line in tasks_json.strip().split('\n'):
+            if not line:
+                continue
+            task = json.loads(line)
+            # History rows are printed as "\_ name.slot"
+            name = task.get('Name', '').lstrip('\\_ ').strip()
+            current_state = task.get('CurrentState', '')
+            conn.execute(
+                """INSERT OR REPLACE INTO tasks 
+                   (id, name, service_id, node_id, image, desired_state, current_state, 
+                    state, state_age, error, last_updated) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                (task.get('ID', ''), name, services.get(name.rsplit('.', 1)[0]),
+                 node_ids.get(task.get('Node', '')), task.get('Image', ''),
+                 task.get('DesiredState', ''), current_state,
+                 current_state.split(' ', 1)[0].lower(), parse_task_age(current_state),
+                 task.get('Error', ''))
+            )
+        
+        # Rollups are recomputed once per pass, in the same transaction as the task upserts
+        refresh_summaries(conn, now)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+# Update images information
+def update_images(full=True):
+    images_json = execute_docker_cmd("docker image ls --format '{{json .}}'")
+    if images_json is None:
+        return False
+    if not images_json:
+        return True
+    
+    conn = get_db_connection()
+    try:
+        # Split multiple JSON objects if needed
+        images = [json.loads(image) for image in images_json.strip().split('\n') if image]
+        
+        for image in images:
+            image_id = image.get('ID', '')
+            repository = image.get('Repository', '')
+            tag = image.get('Tag', '')
+            size_bytes = 0
             
-            service_inspect = execute_docker_cmd(f"docker service inspect {service_id}")
-            if service_inspect:
+            # Convert size string to bytes
+            size_str = image.get('Size', '0')
+            size_parts = size_str.split()
+            if len(size_parts) >= 2:
                 try:
-                    inspect_data = json.loads(service_inspect)
-                    if isinstance(inspect_data, list) and len(inspect_data) > 0:
-                        created_at = inspect_data[0].get('CreatedAt', created_at)
-                        updated_at = inspect_data[0].get('UpdatedAt', updated_at)
-                except json.JSONDecodeError:
+                    size_num = float(size_parts[0])
+                    unit = size_parts[1].upper()
+                    
+                    # Convert to bytes based on unit
+                    multipliers = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
+                    if unit in multipliers:
+                        size_bytes = int(size_num * multipliers[unit])
+                except ValueError:
                     pass
             
+            created_at = image.get('CreatedAt', datetime.datetime.now().isoformat())
+            digest = image.get('Digest', '')
+            
             conn.execute(
-                """INSERT OR REPLACE INTO services 
-                   (id, name, image, replicas, status, created_at, updated_at, last_updated) 
-                   VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
-                (service_id, name, image, replicas, status, created_at, updated_at)
+                """INSERT OR REPLACE INTO images 
+                   (id, repository, tag, digest, size_bytes, created_at, last_updated) 
+                   VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                (image_id, repository, tag, digest, size_bytes, created_at)
+            )
+        
+        conn.commit()
+        refresh_id_index(conn, 'image')
+    finally:
+        conn.close()
+    return True
+
+# Stack deploy cache
+
+# Names Docker accepts for stacks; anything else is rejected before reaching a shell
+STACK_NAME_RE = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$')
+
+def valid_stack_name(stack_name):
+    return bool(stack_name and STACK_NAME_RE.match(stack_name))
+
+# Digest of an image reference as its registry currently serves it: pinned digest, embedded
+# registry manifest, or `docker manifest inspect` (multi-platform images yield their platform
+# digests). The manager's local RepoDigests are not used: they go stale when a tag moves.
+def resolve_image_digest(image):
+    if '@sha256:' in image:
+        return image.split('@', 1)[1]
+    
+    registry_prefix = f"{REGISTRY_HOST}:{REGISTRY_PORT}/"
+    if image.startswith(registry_prefix):
+        repo, _, tag = image[len(registry_prefix):].partition(':')
+        manifest_url = f"http://{REGISTRY_HOST}:{REGISTRY_PORT}/v2/{repo}/manifests/{tag or 'latest'}"
+        digest = execute_docker_cmd(
+            f"curl -s -I -H 'Accept: application/vnd.docker.distribution.manifest.v2+json' {shlex.quote(manifest_url)} "
+            f"| grep -i Docker-Content-Digest | awk '{{print $2}}'"
+        )
+        if digest:
+            return digest.strip()
+    
+    manifest = execute_docker_cmd(f"docker manifest inspect --verbose {shlex.quote(image)}")
+    try:
+        manifest = json.loads(manifest) if manifest else None
+    except json.JSONDecodeError:
+        return None
+    if isinstance(manifest, dict):
+        return (manifest.get('Descriptor') or {}).get('digest')
+    if isinstance(manifest, list):
+        digests = sorted((entry.get('Descriptor') or {}).get('digest') or '' for entry in manifest)
+        if digests and all(digests):
+            return ','.join(digests)
+    return None
+
+# Parse a compose file into a canonical document plus the digests of the images it references
+def normalize_compose(compose_path):
+    import yaml  # Only needed on the deploy path
+    
+    with open(compose_path) as f:
+        document = yaml.safe_load(f) or {}
+    if not isinstance(document, dict):
+        raise ValueError('Compose file must be a mapping')
+    
+    images = sorted(set(
+        service.get('image') for service in (document.get('services') or {}).values()
+        if isinstance(service, dict) and service.get('image')
+    ))
+    digests = {image: resolve_image_digest(image) for image in images}
+    
+    canonical = json.dumps({'compose': document, 'digests': digests},
+                           sort_keys=True, separators=(',', ':'), default=str)
+    return document, digests, hashlib.sha256(canonical.encode()).hexdigest()
+
+# Structured difference between the last deployed compose document and a new one
+def diff_compose(old, new, old_digests, new_digests):
+    diff = {}
+    for section in ('services', 'networks', 'volumes', 'configs', 'secrets'):
+        before = (old or {}).get(section) or {}
+        after = (new or {}).get(section) or {}
+        changes = {
+            'added': sorted(set(after) - set(before)),
+            'removed': sorted(set(before) - set(after)),
+            'changed': {},
+        }
+        for name in sorted(set(before) & set(after)):
+            if before[name] == after[name]:
+                continue
+            if isinstance(before[name], dict) and isinstance(after[name], dict):
+                keys = set(before[name]) | set(after[name])
+                changes['changed'][name] = sorted(k for k in keys if before[name].get(k) != after[name].get(k))
+            else:
+                changes['changed'][name] = []
+        if changes['added'] or changes['removed'] or changes['changed']:
+            diff[section] = changes
+    
+    other = sorted(k for k in set(old or {}) | set(new or {})
+                   if k not in ('services', 'networks', 'volumes', 'configs', 'secrets')
+                   and (old or {}).get(k) != (new or {}).get(k))
+    if other:
+        diff['top_level'] = other
+    
+    images = {image: {'old': (old_digests or {}).get(image), 'new': digest}
+              for image, digest in new_digests.items()
+              if (old_digests or {}).get(image) != digest}
+    if images:
+        diff['image_digests'] = images
+    return diff
+
+# Deploy one stack unless its normalized compose and image digests match the last deploy
+def deploy_stack(stack_name, compose_path, force=False, existing_stacks=None):
+    if not valid_stack_name(stack_name):
+        return {'stack_name': stack_name, 'status': 'failed', 'error': 'Invalid stack name', 'diff': {}}
+    
+    document, digests, compose_hash = normalize_compose(compose_path)
+    
+    conn = get_db_connection()
+    try:
+        previous = conn.execute(
+            'SELECT * FROM stack_deployments WHERE stack_name = ?', (stack_name,)
+        ).fetchone()
+    finally:
+        conn.close()
+    
+    # A stack removed outside this API must be redeployed even if the hash matches, and so must
+    # one whose image digests can't be resolved (a moved tag would otherwise go unnoticed)
+    still_deployed = existing_stacks is None or stack_name in existing_stacks
+    resolved = all(digests.values())
+    if previous and previous['compose_hash'] == compose_hash and still_deployed and resolved and not force:
+        return {
+            'stack_name': stack_name,
+            'status': 'unchanged',
+            'compose_hash': compose_hash,
+            'deployed_at': previous['deployed_at']
+        }
+    
+    old_document = json.loads(previous['compose_json']) if previous else None
+    old_digests = json.loads(previous['image_digests']) if previous else None
+    diff = diff_compose(old_document, document, old_digests, digests)
+    
+    deploy_result = execute_docker_cmd(
+        f"docker stack deploy -c {shlex.quote(compose_path)} {shlex.quote(stack_name)}"
+    )
+    if deploy_result is None:
+        return {'stack_name': stack_name, 'status': 'failed', 'error': 'Failed to deploy stack', 'diff': diff}
+    
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """INSERT OR REPLACE INTO stack_deployments 
+               (stack_name, compose_hash, compose_json, image_digests, deployed_at) 
+               VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+            (stack_name, compose_hash, json.dumps(document, default=str), json.dumps(digests))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    
+    log_event('deploy', 'stack', stack_name,
+              f"Stack deployed from uploaded compose file (hash {compose_hash[:12]})")
+    
+    return {
+        'stack_name': stack_name,
+        'status': 'deployed',
+        'compose_hash': compose_hash,
+        'diff': diff,
+        'details': deploy_result or 'Stack deployed successfully'
+    }
+
+# Names of the stacks currently deployed, or None if Docker could not be asked
+def list_stack_names():
+    stacks_output = execute_docker_cmd("docker stack ls --format '{{.Name}}'")
+    if stacks_output is None:
+        return None
+    return set(line.strip() for line in stacks_output.split('\n') if line.strip())
+
+# Image pre-distribution
+
+# Node label filters ("key" or "key=value") and service names accepted as prepull targets
+PREPULL_LABEL_RE = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*(=[^\s]*)?$')
+SERVICE_NAME_RE = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$')
+
+# Resolve a prepull target ("all", "label:key=value" or "service:name") to node IDs
+def select_prepull_nodes(target):
+    if target.startswith('label:'):
+        label = target[len('label:'):]
+        if not PREPULL_LABEL_RE.match(label):
+            raise ValueError('label target must be "label:<key>" or "label:<key>=<value>"')
+        output = execute_docker_cmd(f"docker node ls -q --filter {shlex.quote('node.label=' + label)}")
+        return [line.strip() for line in (output or '').split('\n') if line.strip()]
+    
+    if target.startswith('service:'):
+        service_name = target[len('service:'):]
+        if not SERVICE_NAME_RE.match(service_name):
+            raise ValueError('service target must be "service:<name>" with a valid service name')
+        output = execute_docker_cmd(
+            f"docker service ps {shlex.quote(service_name)} --filter desired-state=running --format '{{{{.Node}}}}'"
+        )
+        hostnames = set(line.strip() for line in (output or '').split('\n') if line.strip())
+        if not hostnames:
+            return []
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                f"SELECT id FROM nodes WHERE hostname IN ({','.join('?' * len(hostnames))})",
+                list(hostnames)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [row['id'] for row in rows]
+    
+    if target != 'all':
+        raise ValueError('target must be "all", "label:<key>=<value>" or "service:<name>"')
+    
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            "SELECT id FROM nodes WHERE LOWER(status) = 'ready' AND LOWER(availability) != 'drain'"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [row['id'] for row in rows]
+
+def set_prepull_node_status(prepull_id, node_id, status, error=None):
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """UPDATE image_prepull_nodes SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP 
+               WHERE prepull_id = ? AND node_id = ?""",
+            (status, error, prepull_id, node_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+# Pull an image onto one node with a one-shot job pinned to it
+def prepull_on_node(prepull_id, image, node_id):
+    job_name = f"prepull-{prepull_id[:8]}-{node_id[:12]}"
+    set_prepull_node_status(prepull_id, node_id, 'pulling')
+    
+    created = execute_docker_cmd(
+        f"docker service create --detach --name {job_name} --mode replicated-job "
+        f"--restart-condition none --constraint node.id=={shlex.quote(node_id)} --entrypoint true {shlex.quote(image)}"
+    )
+    if created is None:
+        set_prepull_node_status(prepull_id, node_id, 'failed', 'Could not create prepull job')
+        return
+    
+    try:
+        deadline = time.time() + PREPULL_TIMEOUT
+        while time.time() < deadline:
+            task = execute_docker_cmd(
+                f"docker service ps {job_name} --no-trunc --format '{{{{.CurrentState}}}}|{{{{.Error}}}}'"
+            )
+            state, _, error = (task or '').split('\n')[0].partition('|')
+            if state.startswith('Rejected'):
+                # The node could not pull the image
+                set_prepull_node_status(prepull_id, node_id, 'failed', error or state)
+                return
+            if state.startswith(('Complete', 'Failed')):
+                # Either way the image is on the node; "true" may simply not exist inside it
+                set_prepull_node_status(prepull_id, node_id, 'done')
+                return
+            time.sleep(2)
+        set_prepull_node_status(prepull_id, node_id, 'failed', 'Timed out waiting for pull')
+    finally:
+        execute_docker_cmd(f"docker service rm {job_name}")
+
+# Warm an image onto the selected nodes with bounded concurrency. Nodes "already holding" the
+# digest are the ones this API itself warmed within PREPULL_SKIP_MAX_AGE; images pulled some
+# other way are not detected, and a recorded pull may since have been pruned, hence the age limit.
+def run_prepull(prepull_id, image, digest, node_ids, max_parallel):
+    conn = get_db_connection()
+    try:
+        warm = set()
+        if digest:
+            # Only actual pulls count; a skip would otherwise extend an old pull's lifetime
+            warm = set(row['node_id'] for row in conn.execute(
+                """SELECT n.node_id FROM image_prepull_nodes n 
+                   JOIN image_prepulls p ON p.id = n.prepull_id 
+                   WHERE p.digest = ? AND n.status = 'done' AND n.updated_at >= datetime('now', ?)""",
+                (digest, f"-{PREPULL_SKIP_MAX_AGE} seconds")
+            ))
+        for node_id in node_ids:
+            conn.execute(
+                """INSERT INTO image_prepull_nodes (prepull_id, node_id, status, updated_at) 
+                   VALUES (?, ?, ?, CURRENT_TIMESTAMP)""",
+                (prepull_id, node_id, 'skipped' if node_id in warm else 'pending')
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    
+    pending = [node_id for node_id in node_ids if node_id not in warm]
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        list(executor.map(lambda node_id: prepull_on_node(prepull_id, image, node_id), pending))
+    
+    conn = get_db_connection()
+    try:
+        counts = {row['status']: row['count'] for row in conn.execute(
+            'SELECT status, COUNT(*) AS count FROM image_prepull_nodes WHERE prepull_id = ? GROUP BY status',
+            (prepull_id,)
+        )}
+        conn.execute(
+            "UPDATE image_prepulls SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            ('failed' if counts.get('failed') else 'complete', prepull_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    
+    log_event('prepull', 'image', image,
+              ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+# Record a prepull and start it in the background; returns the prepull ID
+def start_prepull(image, target, max_parallel=None):
+    if image.startswith('-') or any(c.isspace() for c in image):
+        raise ValueError('Invalid image reference')
+    node_ids = select_prepull_nodes(target)
+    digest = resolve_image_digest(image)
+    max_parallel = max(1, min(max_parallel or PREPULL_MAX_PARALLEL, PREPULL_MAX_PARALLEL))
+    prepull_id = str(uuid.uuid4())
+    
+    conn = get_db_connection()
+    try:
+        conn.execute(
+            """INSERT INTO image_prepulls (id, image, digest, target, status, created_at) 
+               VALUES (?, ?, ?, ?, 'running', CURRENT_TIMESTAMP)""",
+            (prepull_id, image, digest, target)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    
+    prepull_thread = threading.Thread(
+        target=run_prepull, args=(prepull_id, image, digest, node_ids, max_parallel)
+    )
+    prepull_thread.daemon = True
+    prepull_thread.start()
+    return prepull_id
+
+# Registry metrics
+
+# Metric families scraped from the registry debug listener and how to derive stored values
+REGISTRY_METRIC_FAMILIES = {
+    'registry_http_requests_total': 'counter',
+    'registry_storage_cache_total': 'counter',
+    'registry_http_in_flight_requests': 'gauge',
+    'registry_http_request_duration_seconds': 'histogram',
+    'registry_http_request_size_bytes': 'histogram',
+    'registry_http_response_size_bytes': 'histogram',
+    'registry_storage_action_seconds': 'histogram',
+}
+REGISTRY_QUANTILES = (0.5, 0.95, 0.99)
+
+# Previous scrape (for rates), latest derived values (for the API) and whether the target answered
+REGISTRY_SCRAPE = {'ts': None, 'samples': {}, 'latest': {}, 'reachable': True}
+REGISTRY_LOCK = threading.Lock()
+
+PROMETHEUS_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# Parse Prometheus text exposition into {(name, sorted label items): value}
+def parse_prometheus_text(text):
+    samples = {}
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if '{' in line:
+            name, _, rest = line.partition('{')
+            label_text, _, value_text = rest.rpartition('}')
+            labels = tuple(sorted(PROMETHEUS_LABEL_RE.findall(label_text)))
+        else:
+            name, _, value_text = line.partition(' ')
+            labels = ()
+        try:
+            samples[(name, labels)] = float(value_text.split()[0])
+        except (IndexError, ValueError):
+            continue
+    return samples
+
+def registry_series_name(family, labels):
+    return family + '{' + ','.join(f'{key}={value}' for key, value in labels) + '}'
+
+# Interpolated quantile from cumulative (upper bound, count) buckets, like histogram_quantile()
+def histogram_quantile(quantile, buckets):
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = quantile * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if upper_bound == float('inf'):
+                return lower_bound
+            if count == lower_count:
+                return upper_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+# Derive rates, gauges and histogram quantiles from two consecutive scrapes
+def derive_registry_metrics(previous, current, elapsed):
+    def delta(key):
+        # Counter resets (registry restart) restart the count from zero
+        before = previous.get(key)
+        now = current[key]
+        return now if before is None or now < before else now - before
+    
+    derived = {}
+    histograms = {}
+    for (name, labels), value in current.items():
+        for family, kind in REGISTRY_METRIC_FAMILIES.items():
+            if not name.startswith(family):
+                continue
+            suffix = name[len(family):]
+            if kind == 'gauge' and not suffix:
+                derived.setdefault(registry_series_name(family, labels), {})['value'] = value
+            elif kind == 'counter' and not suffix and elapsed:
+                derived.setdefault(registry_series_name(family, labels), {})['rate'] = delta((name, labels)) / elapsed
+            elif kind == 'histogram' and suffix in ('_bucket', '_sum', '_count'):
+                base_labels = tuple(item for item in labels if item[0] != 'le')
+                histogram = histograms.setdefault((family, base_labels), {'buckets': []})
+                if suffix == '_bucket':
+                    upper_bound = float(dict(labels)['le'].replace('+Inf', 'inf'))
+                    histogram['buckets'].append((upper_bound, delta((name, labels))))
+                elif elapsed:
+                    histogram['sum' if suffix == '_sum' else 'count'] = delta((name, labels)) / elapsed
+            break
+    
+    for (family, labels), histogram in histograms.items():
+        values = {}
+        if 'count' in histogram:
+            values['rate'] = histogram['count']
+        if 'sum' in histogram:
+            # Seconds per second for latencies, bytes per second for sizes
+            values['sum_rate'] = histogram['sum']
+        for quantile in REGISTRY_QUANTILES:
+            result = histogram_quantile(quantile, histogram['buckets'])
+            if result is not None:
+                values[f'p{int(quantile * 100)}'] = result
+        if values:
+            derived[registry_series_name(family, labels)] = values
+    return derived
+
+# Fetch the registry's metrics page without logging every failure (the scraper logs transitions);
+# bounded so a listener that accepts but never answers can't stall the scraper
+def fetch_registry_metrics():
+    result = subprocess.run(['curl', '-s', '-f', '--max-time', str(REGISTRY_SCRAPE_TIMEOUT), REGISTRY_METRICS_URL],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return result.stdout if result.returncode == 0 else None
+
+# Scrape the registry's Prometheus endpoint once and store derived values as history samples
+def scrape_registry_metrics():
+    metrics_text = fetch_registry_metrics()
+    with REGISTRY_LOCK:
+        was_reachable = REGISTRY_SCRAPE['reachable']
+        REGISTRY_SCRAPE['reachable'] = bool(metrics_text)
+    if not metrics_text:
+        if was_reachable:
+            print(f"Registry metrics unreachable at {REGISTRY_METRICS_URL}; retrying every {REGISTRY_SCRAPE_INTERVAL}s")
+        return False
+    if not was_reachable:
+        print(f"Registry metrics reachable again at {REGISTRY_METRICS_URL}")
+    
+    now = time.time()
+    current = {key: value for key, value in parse_prometheus_text(metrics_text).items()
+               if key[0].startswith(tuple(REGISTRY_METRIC_FAMILIES))}
+    
+    with REGISTRY_LOCK:
+        previous_ts = REGISTRY_SCRAPE['ts']
+        previous = REGISTRY_SCRAPE['samples']
+    
+    # The first scrape only sets the baseline for rates and bucket deltas
+    if previous_ts is None:
+        derived = {}
+    else:
+        derived = derive_registry_metrics(previous, current, now - previous_ts)
+    
+    conn = get_db_connection()
+    try:
+        for series, values in derived.items():
+            for metric, value in values.items():
+                record_sample(conn, int(now), 'registry', series, metric, value)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    with REGISTRY_LOCK:
+        REGISTRY_SCRAPE['ts'] = now
+        REGISTRY_SCRAPE['samples'] = current
+        if previous_ts is not None:
+            REGISTRY_SCRAPE['latest'] = derived
+    return True
+
+# Background worker that periodically scrapes registry metrics
+def registry_metrics_worker():
+    while True:
+        try:
+            scrape_registry_metrics()
+        except Exception as e:
+            print(f"Error in registry metrics worker: {e}")
+        time.sleep(REGISTRY_SCRAPE_INTERVAL)
+
+# GlusterFS volume collector
+
+# Operations reported by `gluster volume top`
+GLUSTER_TOP_OPS = ('read', 'write', 'open')
+
+# Latest profile and top output (kept in memory; the numeric series also go to history),
+# and whether the volume answered on the last pass
+GLUSTER_STATE = {'profile_as_of': None, 'profile': {}, 'top_as_of': None, 'top': {}, 'reachable': True}
+GLUSTER_LOCK = threading.Lock()
+
+# Run a gluster CLI command without logging failures (glusterd is routinely not up yet at startup;
+# the worker logs reachability transitions instead). Returns stdout, or None on failure
+def run_gluster_cli(args):
+    try:
+        result = subprocess.run(['gluster'] + args.split(), stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+# Run a gluster CLI command with XML output and return the parsed root, or None
+def gluster_xml(args):
+    import xml.etree.ElementTree as ElementTree  # Only needed by the gluster collector
+    
+    output = run_gluster_cli(f"{args} --xml")
+    if not output:
+        return None
+    try:
+        root = ElementTree.fromstring(output)
+    except ElementTree.ParseError:
+        return None
+    if root.findtext('opRet', '0') != '0':
+        return None
+    return root
+
+def xml_int(element, tag, default=0):
+    try:
+        return int(element.findtext(tag))
+    except (TypeError, ValueError):
+        return default
+
+def xml_float(element, tag, default=0.0):
+    try:
+        return float(element.findtext(tag))
+    except (TypeError, ValueError):
+        return default
+
+# Brick status and capacity from `gluster volume status <volume> detail`
+def update_gluster_bricks():
+    root = gluster_xml(f"volume status {GLUSTER_VOLUME_NAME} detail")
+    if root is None:
+        return False
+    
+    now = int(time.time())
+    conn = get_db_connection()
+    try:
+        for node in root.iter('node'):
+            hostname = node.findtext('hostname', '')
+            path = node.findtext('path', '')
+            # Self-heal and NFS daemons are listed as nodes without a brick path
+            if not path.startswith('/'):
+                continue
+            brick = f"{hostname}:{path}"
+            online = xml_int(node, 'status') == 1
+            size_total = xml_int(node, 'sizeTotal')
+            size_free = xml_int(node, 'sizeFree')
+            inodes_total = xml_int(node, 'inodesTotal')
+            inodes_free = xml_int(node, 'inodesFree')
+            
+            previous = conn.execute(
+                'SELECT online FROM gluster_bricks WHERE brick = ?', (brick,)
+            ).fetchone()
+            track_state(conn, now, 'gluster_brick', brick, previous, {'online': int(online)})
+            record_sample(conn, now, 'gluster_brick', brick, 'online', int(online))
+            record_sample(conn, now, 'gluster_brick', brick, 'size_free', size_free)
+            if size_total:
+                record_sample(conn, now, 'gluster_brick', brick, 'used_percent',
+                              100.0 * (size_total - size_free) / size_total)
+            if inodes_total:
+                record_sample(conn, now, 'gluster_brick', brick, 'inodes_used_percent',
+                              100.0 * (inodes_total - inodes_free) / inodes_total)
+            
+            conn.execute(
+                """INSERT OR REPLACE INTO gluster_bricks 
+                   (brick, volume, hostname, path, online, pid, port, size_total, size_free, 
+                    inodes_total, inodes_free, device, fs_name, last_updated) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
+                (brick, GLUSTER_VOLUME_NAME, hostname, path, int(online), xml_int(node, 'pid'),
+                 xml_int(node, 'port'), size_total, size_free, inodes_total, inodes_free,
+                 node.findtext('device', ''), node.findtext('fsName', ''))
             )
         
         conn.commit()
     finally:
         conn.close()
+    return True
+
+# FOP latencies and throughput since the previous call, from `gluster volume profile <volume> info incremental`
+def update_gluster_profile():
+    root = gluster_xml(f"volume profile {GLUSTER_VOLUME_NAME} info incremental")
+    if root is None:
+        # Profiling isn't started (or the volume didn't exist yet, or glusterd restarted):
+        # switch it on so the next pass reports; a no-op if it is already on
+        run_gluster_cli(f"volume profile {GLUSTER_VOLUME_NAME} start")
+        return False
+    
+    now = int(time.time())
+    profile = {}
+    conn = get_db_connection()
+    try:
+        for brick_element in root.iter('brick'):
+            brick = brick_element.findtext('brickName', '')
+            stats = brick_element.find('intervalStats')
+            if not brick or stats is None:
+                continue
+            duration = xml_float(stats, 'duration')
+            
+            fops = {}
+            for fop in stats.iter('fop'):
+                name = fop.findtext('name', '').upper()
+                hits = xml_int(fop, 'hits')
+                if not name or not hits:
+                    continue
+                fops[name] = {
+                    'hits': hits,
+                    'avg_latency_us': xml_float(fop, 'avgLatency'),
+                    'min_latency_us': xml_float(fop, 'minLatency'),
+                    'max_latency_us': xml_float(fop, 'maxLatency'),
+                }
+                record_sample(conn, now, 'gluster_brick', brick, f'fop.{name}.avg_latency_us',
+                              fops[name]['avg_latency_us'])
+                record_sample(conn, now, 'gluster_brick', brick, f'fop.{name}.max_latency_us',
+                              fops[name]['max_latency_us'])
+                if duration:
+                    record_sample(conn, now, 'gluster_brick', brick, f'fop.{name}.rate', hits / duration)
+            
+            read_rate = xml_int(stats, 'totalRead') / duration if duration else 0.0
+            write_rate = xml_int(stats, 'totalWrite') / duration if duration else 0.0
+            record_sample(conn, now, 'gluster_brick', brick, 'read_bytes_rate', read_rate)
+            record_sample(conn, now, 'gluster_brick', brick, 'write_bytes_rate', write_rate)
+            
+            profile[brick] = {
+                'duration': duration,
+                'read_bytes_rate': read_rate,
+                'write_bytes_rate': write_rate,
+                'fops': fops,
+            }
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    with GLUSTER_LOCK:
+        GLUSTER_STATE['profile_as_of'] = now
+        GLUSTER_STATE['profile'] = profile
+    return True
+
+# Hot files per brick from `gluster volume top <volume> <op>`
+def update_gluster_top():
+    top = {}
+    for op in GLUSTER_TOP_OPS:
+        root = gluster_xml(f"volume top {GLUSTER_VOLUME_NAME} {op} list-cnt {GLUSTER_TOP_COUNT}")
+        if root is None:
+            continue
+        for brick_element in root.iter('brick'):
+            brick = brick_element.findtext('name', '')
+            files = [{'filename': entry.findtext('filename', ''), 'count': xml_int(entry, 'count')}
+                     for entry in brick_element.iter('file')]
+            top.setdefault(brick, {})[op] = files
+    
+    with GLUSTER_LOCK:
+        GLUSTER_STATE['top_as_of'] = int(time.time())
+        GLUSTER_STATE['top'] = top
+    return bool(top)
+
+# Background worker that periodically collects GlusterFS volume health and performance
+def gluster_worker():
+    while True:
+        try:
+            reachable = update_gluster_bricks()
+            with GLUSTER_LOCK:
+                was_reachable = GLUSTER_STATE['reachable']
+                GLUSTER_STATE['reachable'] = reachable
+            if reachable:
+                if not was_reachable:
+                    print(f"GlusterFS volume {GLUSTER_VOLUME_NAME} reachable again")
+                if GLUSTER_PROFILE:
+                    update_gluster_profile()
+                update_gluster_top()
+            elif was_reachable:
+                # glusterd not running or the volume not created yet; profile and top would fail too
+                print(f"GlusterFS volume {GLUSTER_VOLUME_NAME} unreachable; retrying every {GLUSTER_SCRAPE_INTERVAL}s")
+        except Exception as e:
+            print(f"Error in gluster worker: {e}")
+        time.sleep(GLUSTER_SCRAPE_INTERVAL)
+
+# Collectors in pass order, keyed by the resource name used for sync state and API paths
+SYNC_RESOURCES = {
+    'nodes': update_nodes,
+    'services': update_services,
+    'containers': update_containers,
+    'images': update_images,
+    'tasks': update_tasks,
+}
+
+# Historical state tracking
+
+# Rollup tiers, finest first: (name, table, bucket seconds, retention, widest window served)
+HISTORY_TIERS = [
+    ('raw', 'history_raw', None, HISTORY_RAW_RETENTION, 6 * 3600),
+    ('1m', 'history_1m', 60, HISTORY_1M_RETENTION, 7 * 24 * 3600),
+    ('1h', 'history_1h', 3600, HISTORY_1H_RETENTION, None),
+]
+
+# Seconds behind now that rollups stop, so samples whose ts was taken before a slow write still land
+HISTORY_ROLLUP_GRACE = 60
+
+# Cache of (object_type, object_id, metric) -> history_series.id
+SERIES_IDS = {}
+SERIES_LOCK = threading.Lock()
+
+# Look up (or create) the integer id of a history series
+def get_series_id(conn, object_type, object_id, metric, create=True):
+    key = (object_type, object_id, metric)
+    with SERIES_LOCK:
+        series_id = SERIES_IDS.get(key)
+    if series_id is None:
+        series_id = conn.pending_series.get(key)
+    if series_id is not None:
+        return series_id
+    
+    row = conn.execute(
+        'SELECT id FROM history_series WHERE object_type = ? AND object_id = ? AND metric = ?',
+        key
+    ).fetchone()
+    if row:
+        # Not one of this connection's uncommitted inserts, so the row is committed
+        with SERIES_LOCK:
+            SERIES_IDS[key] = row['id']
+        return row['id']
+    if not create:
+        return None
+    
+    # Cached only when the caller commits; a rollback must not leave a reusable id behind
+    series_id = conn.execute(
+        'INSERT INTO history_series (object_type, object_id, metric) VALUES (?, ?, ?)',
+        key
+    ).lastrowid
+    conn.pending_series[key] = series_id
+    return series_id
+
+# Append a raw sample for a series
+def record_sample(conn, ts, object_type, object_id, metric, value):
+    series_id = get_series_id(conn, object_type, object_id, metric)
+    conn.execute(
+        'INSERT OR REPLACE INTO history_raw (series_id, ts, value) VALUES (?, ?, ?)',
+        (series_id, ts, value)
+    )
+
+# Append a transition row for every field whose value differs from the previous row
+def track_state(conn, ts, object_type, object_id, previous, current):
+    for field, new_value in current.items():
+        old_value = previous[field] if previous else None
+        if old_value is not None and str(old_value) == str(new_value):
+            continue
+        conn.execute(
+            """INSERT INTO state_transitions 
+               (ts, object_type, object_id, field, old_value, new_value) 
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (ts, object_type, object_id, field,
+             None if old_value is None else str(old_value), str(new_value))
+        )
+
+# Parse the desired count out of a replicas string like "2/3" or "1/1 (max 1 per node)"
+def parse_desired_replicas(replicas_str):
+    if '/' not in replicas_str:
+        return 0
+    try:
+        return int(replicas_str.split('/')[1].split()[0])
+    except (IndexError, ValueError):
+        return 0
+
+def get_rollup_checkpoint(conn, tier):
+    row = conn.execute(
+        'SELECT next_bucket FROM history_rollup_state WHERE tier = ?', (tier,)
+    ).fetchone()
+    return row['next_bucket'] if row else 0
+
+# Roll complete buckets up one tier, apply per-tier retention and drop series with no rows left
+def rollup_history():
+    now = int(time.time())
+    conn = get_db_connection()
+    try:
+        source = 'history_raw'
+        # Each tier only rolls up what its source tier has already completed
+        ready = now - HISTORY_ROLLUP_GRACE
+        for tier, table, bucket_size, retention, _ in HISTORY_TIERS[1:]:
+            start = get_rollup_checkpoint(conn, tier)
+            end = ready - ready % bucket_size
+            ready = min(ready, max(start, end))
+            if end > start:
+                if source == 'history_raw':
+                    select = f"""SELECT series_id, ts - ts % {bucket_size}, COUNT(*), 
+                                        SUM(value), MIN(value), MAX(value) 
+                                 FROM history_raw WHERE ts >= ? AND ts < ? 
+                                 GROUP BY series_id, ts - ts % {bucket_size}"""
+                else:
+                    select = f"""SELECT series_id, bucket - bucket % {bucket_size}, SUM(count), 
+                                        SUM(sum), MIN(min), MAX(max) 
+                                 FROM {source} WHERE bucket >= ? AND bucket < ? 
+                                 GROUP BY series_id, bucket - bucket % {bucket_size}"""
+                conn.execute(
+                    f'INSERT OR REPLACE INTO {table} (series_id, bucket, count, sum, min, max) {select}',
+                    (start, end)
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO history_rollup_state (tier, next_bucket) VALUES (?, ?)',
+                    (tier, end)
+                )
+            source = table
+        
+        # Retention: each tier only keeps its own window
+        for tier, table, bucket_size, retention, _ in HISTORY_TIERS:
+            column = 'ts' if bucket_size is None else 'bucket'
+            conn.execute(f'DELETE FROM {table} WHERE {column} < ?', (now - retention,))
+        conn.execute('DELETE FROM state_transitions WHERE ts < ?', (now - HISTORY_1H_RETENTION,))
+        
+        # Series of containers, prepull jobs and label sets that have aged out of every tier
+        expired = conn.execute(
+            """SELECT id, object_type, object_id, metric FROM history_series s 
+               WHERE NOT EXISTS (SELECT 1 FROM history_raw WHERE series_id = s.id) 
+                 AND NOT EXISTS (SELECT 1 FROM history_1m WHERE series_id = s.id) 
+                 AND NOT EXISTS (SELECT 1 FROM history_1h WHERE series_id = s.id)"""
+        ).fetchall()
+        conn.executemany('DELETE FROM history_series WHERE id = ?', [(row['id'],) for row in expired])
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    with SERIES_LOCK:
+        for row in expired:
+            SERIES_IDS.pop((row['object_type'], row['object_id'], row['metric']), None)
+
+# Pick the finest tier that still holds data for start and serves a window of this width
+def select_history_tier(start, end, now=None):
+    now = now or int(time.time())
+    for tier in HISTORY_TIERS:
+        _, _, _, retention, max_window = tier
+        if start >= now - retention and (max_window is None or end - start <= max_window):
+            return tier
+    return HISTORY_TIERS[-1]
+
+# Read a series over [start, end] from the appropriate tier
+def query_history(conn, series_id, start, end):
+    name, table, bucket_size, _, _ = select_history_tier(start, end)
+    
+    if bucket_size is None:
+        rows = conn.execute(
+            """SELECT ts, value AS avg, value AS min, value AS max, 1 AS count 
+               FROM history_raw WHERE series_id = ? AND ts >= ? AND ts <= ? ORDER BY ts""",
+            (series_id, start, end)
+        ).fetchall()
+        return name, [dict(row) for row in rows]
+    
+    rows = conn.execute(
+        f"""SELECT bucket AS ts, sum / count AS avg, min, max, count 
+            FROM {table} WHERE series_id = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket""",
+        (series_id, start - start % bucket_size, end)
+    ).fetchall()
+    points = [dict(row) for row in rows]
+    
+    # Buckets past the rollup checkpoint are aggregated on the fly from the tier below
+    checkpoint = max(get_rollup_checkpoint(conn, name), start - start % bucket_size)
+    if checkpoint <= end:
+        index = [tier[0] for tier in HISTORY_TIERS].index(name)
+        _, source, source_bucket, _, _ = HISTORY_TIERS[index - 1]
+        if source_bucket is None:
+            tail = f"""SELECT ts - ts % {bucket_size} AS ts, AVG(value) AS avg, MIN(value) AS min, 
+                              MAX(value) AS max, COUNT(*) AS count 
+                       FROM history_raw WHERE series_id = ? AND ts >= ? AND ts <= ? 
+                       GROUP BY ts - ts % {bucket_size} ORDER BY 1"""
+        else:
+            tail = f"""SELECT bucket - bucket % {bucket_size} AS ts, SUM(sum) / SUM(count) AS avg, 
+                              MIN(min) AS min, MAX(max) AS max, SUM(count) AS count 
+                       FROM {source} WHERE series_id = ? AND bucket >= ? AND bucket <= ? 
+                       GROUP BY bucket - bucket % {bucket_size} ORDER BY 1"""
+        points = [p for p in points if p['ts'] < checkpoint]
+        points.extend(dict(row) for row in conn.execute(tail, (series_id, checkpoint, end)))
+    
+    return name, points
+
+# Health rollups
+
+# Task counts per group column (service_id or node_id), one grouped pass over tasks.
+# Swarm replaces failed tasks rather than restarting containers, so every failed or rejected
+# task in the retained history counts as a restart, and recent ones as failing.
+def count_tasks_by(conn, column):
+    rows = conn.execute(
+        f"""SELECT {column} AS key, 
+                   SUM(state = 'running') AS running, 
+                   SUM(state IN ('shutdown', 'complete')) AS stopped, 
+                   SUM(state IN ('failed', 'rejected') AND state_age IS NOT NULL AND state_age <= ?) AS failed, 
+                   SUM(state IN ('failed', 'rejected')) AS restarts 
+            FROM tasks WHERE {column} IS NOT NULL GROUP BY {column}""",
+        (SUMMARY_FAILED_WINDOW,)
+    ).fetchall()
+    return {row['key']: row for row in rows}
+
+def service_health(desired, running):
+    if desired == 0:
+        return 'inactive'
+    if running >= desired:
+        return 'healthy'
+    if running == 0:
+        return 'down'
+    return 'degraded'
+
+def node_health(status, availability, failed):
+    if status.lower() != 'ready':
+        return 'down'
+    if availability.lower() == 'drain':
+        return 'drained'
+    if failed:
+        return 'degraded'
+    return 'healthy'
+
+# Write one summary row, keeping last_change unless the counts or verdict moved
+def upsert_summary(conn, table, key_column, key, previous, values, now):
+    changed = previous is None or any(previous[field] != value for field, value in values.items())
+    last_change = now if changed else previous['last_change']
+    columns = [key_column] + list(values) + ['last_change']
+    conn.execute(
+        f"""INSERT OR REPLACE INTO {table} ({', '.join(columns)}, last_updated) 
+            VALUES ({', '.join('?' * len(columns))}, CURRENT_TIMESTAMP)""",
+        [key] + list(values.values()) + [last_change]
+    )
+
+# Recompute service and node summaries inside the caller's transaction
+def refresh_summaries(conn, now):
+    empty = {'running': 0, 'stopped': 0, 'failed': 0, 'restarts': 0}
+    
+    by_service = count_tasks_by(conn, 'service_id')
+    previous = {row['service_id']: row for row in conn.execute('SELECT * FROM service_summary')}
+    for service in conn.execute('SELECT id, name, replicas, desired_replicas FROM services').fetchall():
+        counts = by_service.get(service['id'], empty)
+        desired = service['desired_replicas'] or 0
+        health = service_health(desired, service['replicas'])
+        track_state(conn, now, 'service', service['id'], previous.get(service['id']), {'health': health})
+        upsert_summary(conn, 'service_summary', 'service_id', service['id'], previous.get(service['id']), {
+            'name': service['name'],
+            'desired_replicas': desired,
+            'running_replicas': service['replicas'],
+            'containers_running': counts['running'] or 0,
+            'containers_stopped': counts['stopped'] or 0,
+            'containers_failed': counts['failed'] or 0,
+            'restarts': counts['restarts'] or 0,
+            'health': health,
+        }, now)
+    conn.execute('DELETE FROM service_summary WHERE service_id NOT IN (SELECT id FROM services)')
+    
+    by_node = count_tasks_by(conn, 'node_id')
+    previous = {row['node_id']: row for row in conn.execute('SELECT * FROM node_summary')}
+    for node in conn.execute('SELECT id, hostname, status, availability FROM nodes').fetchall():
+        counts = by_node.get(node['id'], empty)
+        health = node_health(node['status'], node['availability'], counts['failed'])
+        track_state(conn, now, 'node', node['id'], previous.get(node['id']), {'health': health})
+        upsert_summary(conn, 'node_summary', 'node_id', node['id'], previous.get(node['id']), {
+            'hostname': node['hostname'],
+            'status': node['status'],
+            'availability': node['availability'],
+            'containers_running': counts['running'] or 0,
+            'containers_stopped': counts['stopped'] or 0,
+            'containers_failed': counts['failed'] or 0,
+            'restarts': counts['restarts'] or 0,
+            'health': health,
+        }, now)
+    conn.execute('DELETE FROM node_summary WHERE node_id NOT IN (SELECT id FROM nodes)')
+
+# ID prefix index
+
+# Sorted (key, object_type, object_id, kind) entries; any unique prefix of a key resolves by bisection
+class PrefixIndex:
+    def __init__(self):
+        self.entries = []
+        self.members = {}
+        self.lock = threading.Lock()
+    
+    def sync(self, object_type, members):
+        """Replace the (key, object_id, kind) members of one object type, touching only the differences"""
+        members = set((key, object_id, kind) for key, object_id, kind in members if key)
+        with self.lock:
+            previous = self.members.get(object_type, set())
+            for key, object_id, kind in previous - members:
+                entry = (key, object_type, object_id, kind)
+                position = bisect.bisect_left(self.entries, entry)
+                if position < len(self.entries) and self.entries[position] == entry:
+                    del self.entries[position]
+            for key, object_id, kind in members - previous:
+                bisect.insort(self.entries, (key, object_type, object_id, kind))
+            self.members[object_type] = members
+    
+    def resolve(self, prefix, object_type=None, limit=20):
+        """Return distinct objects whose ID or name starts with prefix; exact matches win"""
+        matches = {}
+        exact = {}
+        with self.lock:
+            position = bisect.bisect_left(self.entries, (prefix,))
+            while position < len(self.entries) and len(matches) < limit:
+                key, entry_type, object_id, kind = self.entries[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                if object_type and entry_type != object_type:
+                    continue
+                match = {'type': entry_type, 'id': object_id, 'matched': kind, 'key': key}
+                matches.setdefault((entry_type, object_id), match)
+                if key == prefix:
+                    exact.setdefault((entry_type, object_id), match)
+        return list((exact or matches).values())
+
+ID_INDEX = PrefixIndex()
+
+# Where each object type's IDs and names come from
+ID_INDEX_SOURCES = {
+    'node': 'SELECT id, hostname AS name FROM nodes',
+    'service': 'SELECT id, name FROM services',
+    'container': 'SELECT id, name FROM containers',
+    'image': "SELECT id, repository || ':' || tag AS name FROM images",
+}
+
+# Sync the prefix index for one object type with what the collector just wrote
+def refresh_id_index(conn, object_type):
+    members = []
+    for row in conn.execute(ID_INDEX_SOURCES[object_type]).fetchall():
+        members.append((row['id'], row['id'], 'id'))
+        members.append((row['name'], row['id'], 'name'))
+    ID_INDEX.sync(object_type, members)
+
+# Load the prefix index from the persisted tables
+def load_id_index():
+    conn = get_db_connection()
+    try:
+        for object_type in ID_INDEX_SOURCES:
+            refresh_id_index(conn, object_type)
+    finally:
+        conn.close()
+
+# Resolve an ID, ID prefix or name: (match, []) when unique, (None, candidates) otherwise
+def resolve_object_id(object_type, value):
+    # Image IDs are reported with their digest algorithm
+    if value.startswith('sha256:'):
+        value = value[len('sha256:'):]
+    
+    matches = ID_INDEX.resolve(value, object_type)
+    
+    # Full 64-char IDs are longer than the 12-char short IDs `docker ps` reports
+    if not matches and len(value) > 12:
+        matches = [match for match in ID_INDEX.resolve(value[:12], object_type)
+                   if match['matched'] == 'id' and match['key'] == value[:12]]
+    
+    if len(matches) == 1:
+        return matches[0], []
+    return None, matches
+
+# Container resource metrics
+
+# Fixed-size ring of stats samples, one array('d') column per field
+class MetricsRing:
+    FIELDS = ('ts', 'cpu_percent', 'mem_bytes', 'mem_limit',
+              'net_rx', 'net_tx', 'blk_read', 'blk_write')
+    
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.pos = 0
+        self.columns = {field: array('d', [0.0]) * size for field in self.FIELDS}
+        self.lock = threading.Lock()
+    
+    def append(self, sample):
+        with self.lock:
+            for field in self.FIELDS:
+                self.columns[field][self.pos] = sample.get(field, 0.0)
+            self.pos = (self.pos + 1) % self.size
+            self.count = min(self.count + 1, self.size)
+    
+    def samples(self, since=None):
+        """Return buffered samples oldest first, optionally only those newer than since"""
+        with self.lock:
+            start = (self.pos - self.count) % self.size
+            indexes = [(start + i) % self.size for i in range(self.count)]
+            result = [{field: self.columns[field][i] for field in self.FIELDS} for i in indexes]
+        if since is not None:
+            result = [sample for sample in result if sample['ts'] > since]
+        return result
+
+# Summarize a run of samples: averages for gauges, per-second rates for counters
+def summarize_samples(samples):
+    if not samples:
+        return None
+    
+    first, last = samples[0], samples[-1]
+    elapsed = last['ts'] - first['ts']
+    
+    def rate(field):
+        if elapsed <= 0:
+            return 0.0
+        return max(last[field] - first[field], 0.0) / elapsed
+    
+    return {
+        'ts': last['ts'],
+        'samples': len(samples),
+        'cpu_percent': sum(s['cpu_percent'] for s in samples) / len(samples),
+        'cpu_percent_max': max(s['cpu_percent'] for s in samples),
+        'mem_bytes': sum(s['mem_bytes'] for s in samples) / len(samples),
+        'mem_bytes_max': max(s['mem_bytes'] for s in samples),
+        'mem_limit': last['mem_limit'],
+        'net_rx_rate': rate('net_rx'),
+        'net_tx_rate': rate('net_tx'),
+        'blk_read_rate': rate('blk_read'),
+        'blk_write_rate': rate('blk_write'),
+    }
 
-# Update containers information
-def update_containers():
-    containers_json = execute_docker_cmd("docker ps -a --format '{{json .}}'")
-    if not containers_json:
-        return
+# Convert one Docker Engine API stats document into a flat sample
+def parse_stats_sample(stats):
+    cpu_stats = stats.get('cpu_stats') or {}
+    precpu_stats = stats.get('precpu_stats') or {}
+    cpu_delta = ((cpu_stats.get('cpu_usage') or {}).get('total_usage', 0) -
+                 (precpu_stats.get('cpu_usage') or {}).get('total_usage', 0))
+    system_delta = cpu_stats.get('system_cpu_usage', 0) - precpu_stats.get('system_cpu_usage', 0)
+    online_cpus = (cpu_stats.get('online_cpus') or
+                   len((cpu_stats.get('cpu_usage') or {}).get('percpu_usage') or []) or 1)
+    cpu_percent = cpu_delta / system_delta * online_cpus * 100.0 if system_delta > 0 and cpu_delta > 0 else 0.0
+    
+    # Exclude page cache the same way `docker stats` does (cgroup v2 / v1 keys)
+    memory_stats = stats.get('memory_stats') or {}
+    memory_detail = memory_stats.get('stats') or {}
+    cache = memory_detail.get('inactive_file', memory_detail.get('total_inactive_file', 0))
+    mem_bytes = max(memory_stats.get('usage', 0) - cache, 0)
     
+    net_rx = net_tx = 0
+    for network in (stats.get('networks') or {}).values():
+        net_rx += network.get('rx_bytes', 0)
+        net_tx += network.get('tx_bytes', 0)
+    
+    blk_read = blk_write = 0
+    for entry in (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []:
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            blk_read += entry.get('value', 0)
+        elif op == 'write':
+            blk_write += entry.get('value', 0)
+    
+    return {
+        'ts': time.time(),
+        'cpu_percent': cpu_percent,
+        'mem_bytes': mem_bytes,
+        'mem_limit': memory_stats.get('limit', 0),
+        'net_rx': net_rx,
+        'net_tx': net_tx,
+        'blk_read': blk_read,
+        'blk_write': blk_write,
+    }
+
+# One long-lived streaming stats subscription for a container
+class StatsStream:
+    def __init__(self, container_id):
+        self.container_id = container_id
+        self.ring = MetricsRing(METRICS_RING_SIZE)
+        self.last_flush = 0.0
+        self.stopped = threading.Event()
+        self.process = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+    
+    def start(self):
+        self.thread.start()
+    
+    def stop(self):
+        self.stopped.set()
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+    
+    def run(self):
+        stats_url = f"http://localhost/containers/{self.container_id}/stats"
+        while not self.stopped.is_set():
+            try:
+                self.process = subprocess.Popen(
+                    ['curl', '-s', '-N', '--unix-socket', DOCKER_SOCKET, stats_url],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+                for line in self.process.stdout:
+                    if self.stopped.is_set():
+                        break
+                    try:
+                        stats = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if 'message' in stats and 'cpu_stats' not in stats:
+                        # Error document, e.g. the container no longer exists
+                        break
+                    self.ring.append(parse_stats_sample(stats))
+            except Exception as e:
+                print(f"Stats stream error for {self.container_id}: {e}")
+            finally:
+                if self.process and self.process.poll() is None:
+                    self.process.terminate()
+            
+            # Reconnect after a short pause unless the collector dropped us
+            self.stopped.wait(5)
+
+# Aggregates flushed to history per container (distinct from the collector's 'running' state sample)
+CONTAINER_RESOURCE_METRICS = ('cpu_percent', 'mem_bytes', 'net_rx_rate', 'net_tx_rate',
+                              'blk_read_rate', 'blk_write_rate')
+
+# Active stats streams, keyed by container ID
+STATS_STREAMS = {}
+STATS_LOCK = threading.Lock()
+
+# Start streams for running containers and stop streams for ones that are gone
+def sync_stats_streams():
     conn = get_db_connection()
     try:
-        # Split multiple JSON objects if needed
-        containers = [json.loads(container) for container in containers_json.strip().split('\n') if container]
-        
-        for container in containers:
-            container_id = container.get('ID', '')
-            image = container.get('Image', '')
-            command = container.get('Command', '')
-            status = container.get('Status', '')
-            state = 'running' if status.lower().startswith('up') else 'stopped'
-            created_at = container.get('CreatedAt', datetime.datetime.now().isoformat())
-            ports = container.get('Ports', '')
-            
-            # Get node ID from container info (for swarm containers)
-            node_id = None
-            service_id = None
-            
-            container_inspect = execute_docker_cmd(f"docker inspect {container_id}")
-            if container_inspect:
-                try:
-                    inspect_data = json.loads(container_inspect)
-                    if isinstance(inspect_data, list) and len(inspect_data) > 0:
-                        # Extract data from inspect
-                        node_id = inspect_data[0].get('Node', {}).get('ID', None)
-                        service_id = inspect_data[0].get('Service', {}).get('ID', None)
-                        
-                        # Get timestamp info
-                        state_data = inspect_data[0].get('State', {})
-                        started_at = state_data.get('StartedAt', None)
-                        finished_at = state_data.get('FinishedAt', None)
-                        
-                        conn.execute(
-                            """INSERT OR REPLACE INTO containers 
-                               (id, service_id, node_id, image, command, status, state, 
-                                created_at, started_at, finished_at, ports, last_updated) 
-                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
-                            (container_id, service_id, node_id, image, command, status, 
-                             state, created_at, started_at, finished_at, ports)
-                        )
-                except json.JSONDecodeError:
-                    pass
-        
-        conn.commit()
+        running = [row['id'] for row in conn.execute(
+            "SELECT id FROM containers WHERE state = 'running' ORDER BY id"
+        ).fetchall()]
     finally:
         conn.close()
+    
+    running_set = set(running)
+    with STATS_LOCK:
+        for container_id in list(STATS_STREAMS):
+            if container_id not in running_set:
+                STATS_STREAMS.pop(container_id).stop()
+        
+        for container_id in running:
+            if container_id in STATS_STREAMS:
+                continue
+            if len(STATS_STREAMS) >= METRICS_MAX_STREAMS:
+                print(f"Stats stream limit ({METRICS_MAX_STREAMS}) reached, not streaming remaining containers")
+                break
+            stream = StatsStream(container_id)
+            STATS_STREAMS[container_id] = stream
+            stream.start()
 
-# Update images information
-def update_images():
-    images_json = execute_docker_cmd("docker image ls --format '{{json .}}'")
-    if not images_json:
-        return
+# Write per-container aggregates of samples since the last flush into history
+def flush_container_metrics():
+    with STATS_LOCK:
+        streams = list(STATS_STREAMS.values())
     
+    now = int(time.time())
     conn = get_db_connection()
     try:
-        # Split multiple JSON objects if needed
-        images = [json.loads(image) for image in images_json.strip().split('\n') if image]
-        
-        for image in images:
-            image_id = image.get('ID', '')
-            repository = image.get('Repository', '')
-            tag = image.get('Tag', '')
-            size_bytes = 0
-            
-            # Convert size string to bytes
-            size_str = image.get('Size', '0')
-            size_parts = size_str.split()
-            if len(size_parts) >= 2:
-                try:
-                    size_num = float(size_parts[0])
-                    unit = size_parts[1].upper()
-                    
-                    # Convert to bytes based on unit
-                    multipliers = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
-                    if unit in multipliers:
-                        size_bytes = int(size_num * multipliers[unit])
-                except ValueError:
-                    pass
-            
-            created_at = image.get('CreatedAt', datetime.datetime.now().isoformat())
-            digest = image.get('Digest', '')
+        for stream in streams:
+            samples = stream.ring.samples()
+            fresh = [sample for sample in samples if sample['ts'] > stream.last_flush]
+            summary = summarize_samples(fresh)
+            if not summary:
+                continue
             
-            conn.execute(
-                """INSERT OR REPLACE INTO images 
-                   (id, repository, tag, digest, size_bytes, created_at, last_updated) 
-                   VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)""",
-                (image_id, repository, tag, digest, size_bytes, created_at)
-            )
-        
+            # Anchor counter rates on the last sample of the previous flush
+            anchored = samples[len(samples) - len(fresh) - 1:] if len(samples) > len(fresh) else fresh
+            for field, value in summarize_samples(anchored).items():
+                if field.endswith('_rate'):
+                    summary[field] = value
+            stream.last_flush = summary['ts']
+            for metric in CONTAINER_RESOURCE_METRICS:
+                record_sample(conn, now, 'container', stream.container_id, metric, summary[metric])
         conn.commit()
     finally:
         conn.close()
 
+# Background worker that periodically flushes container metrics
+def metrics_flush_worker():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            flush_container_metrics()
+        except Exception as e:
+            print(f"Error in metrics flush worker: {e}")
+
 # API Routes
 
+# Seconds from process start to the first response served, once known
+FIRST_RESPONSE = {}
+
+# Poll the API over loopback from startup so time-to-first-response measures when the server
+# became ready to serve, not when a client first happened to call it
+def startup_probe():
+    import urllib.request  # Only needed for the probe
+    import urllib.error
+    
+    while not FIRST_RESPONSE:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{MONITOR_PORT}/api/status", timeout=5).close()
+        except urllib.error.HTTPError:
+            pass  # Any response counts; after_request has already recorded it
+        except OSError:
+            time.sleep(0.05)
+
+# Attach staleness metadata for the resource behind the path and track time-to-first-response
+@app.after_request
+def add_sync_metadata(response):
+    parts = request.path.strip('/').split('/')
+    resource = parts[1] if len(parts) > 1 and parts[0] == 'api' else None
+    with SYNC_LOCK:
+        state = sync_metadata(SYNC_STATE[resource]) if resource in SYNC_STATE else None
+    if state:
+        response.headers['X-As-Of'] = str(state['as_of'] or '')
+        response.headers['X-Syncing'] = 'true' if state['syncing'] else 'false'
+    
+    if not FIRST_RESPONSE:
+        elapsed = time.time() - START_TIME
+        with SYNC_LOCK:
+            first = FIRST_RESPONSE.setdefault('seconds', elapsed) == elapsed
+    else:
+        first = False
+    if first:
+        print(f"Time to first response: {elapsed:.3f}s")
+        conn = get_db_connection()
+        try:
+            record_sample(conn, int(time.time()), 'monitor', 'startup', 'time_to_first_response', elapsed)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Could not record time to first response: {e}")
+        finally:
+            conn.close()
+    
+    return response
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Get overall system status"""
@@ -262,12 +1959,21 @@ def get_status():
         containers = conn.execute('SELECT COUNT(*) as count FROM containers').fetchone()
         running = conn.execute("SELECT COUNT(*) as count FROM containers WHERE state = 'running'").fetchone()
         
+        # Per-resource staleness; counts above may predate a restart until as_of catches up
+        now = int(time.time())
+        with SYNC_LOCK:
+            sync = {resource: sync_metadata(state) for resource, state in SYNC_STATE.items()}
+        for state in sync.values():
+            state['age_seconds'] = now - state['as_of'] if state['as_of'] else None
+        
         return jsonify({
             'status': 'healthy',
             'nodes': nodes['count'],
             'services': services['count'],
             'containers': containers['count'],
             'running_containers': running['count'],
+            'sync': sync,
+            'time_to_first_response': FIRST_RESPONSE.get('seconds'),
             'timestamp': datetime.datetime.now().isoformat()
         })
     finally:
@@ -283,22 +1989,57 @@ def get_nodes():
     finally:
         conn.close()
 
+@app.route('/api/nodes/summary', methods=['GET'])
+def get_nodes_summary():
+    """Get per-node health rollups, optionally filtered by health"""
+    health = request.args.get('health')
+    
+    conn = get_db_connection()
+    try:
+        query = 'SELECT * FROM node_summary'
+        params = []
+        if health:
+            query += ' WHERE health = ?'
+            params.append(health)
+        
+        rows = [dict(row) for row in conn.execute(query + ' ORDER BY hostname', params).fetchall()]
+        totals = {}
+        for row in conn.execute('SELECT health, COUNT(*) AS count FROM node_summary GROUP BY health'):
+            totals[row['health']] = row['count']
+        
+        return jsonify({'nodes': rows, 'health_totals': totals})
+    finally:
+        conn.close()
+
 @app.route('/api/nodes/<node_id>', methods=['GET'])
 def get_node(node_id):
     """Get detailed information about a specific node"""
     conn = get_db_connection()
     try:
         node = conn.execute('SELECT * FROM nodes WHERE id = ?', (node_id,)).fetchone()
+        if not node:
+            # Fall back to a unique ID prefix or name
+            match, candidates = resolve_object_id('node', node_id)
+            if candidates:
+                return jsonify({'error': 'Ambiguous node ID prefix', 'candidates': candidates}), 409
+            if match:
+                node_id = match['id']
+                node = conn.execute('SELECT * FROM nodes WHERE id = ?', (node_id,)).fetchone()
         if not node:
             return jsonify({'error': 'Node not found'}), 404
         
-        # Get containers running on this node
-        containers = conn.execute(
-            'SELECT * FROM containers WHERE node_id = ?', (node_id,)
-        ).fetchall()
-        
         result = dict(node)
-        result['containers'] = [dict(container) for container in containers]
+        summary = conn.execute(
+            'SELECT * FROM node_summary WHERE node_id = ?', (node_id,)
+        ).fetchone()
+        result['summary'] = dict(summary) if summary else None
+        
+        # Inline container rows are optional; the summary already carries the counts
+        if request.args.get('containers', 'true').lower() not in ('0', 'false', 'no'):
+            containers = conn.execute(
+                'SELECT * FROM containers WHERE node_id = ?', (node_id,)
+            ).fetchall()
+            result['containers'] = [dict(container) for container in containers]
         return jsonify(result)
     finally:
         conn.close()
@@ -313,22 +2054,57 @@ def get_services():
     finally:
         conn.close()
 
+@app.route('/api/services/summary', methods=['GET'])
+def get_services_summary():
+    """Get per-service health rollups, optionally filtered by health"""
+    health = request.args.get('health')
+    
+    conn = get_db_connection()
+    try:
+        query = 'SELECT * FROM service_summary'
+        params = []
+        if health:
+            query += ' WHERE health = ?'
+            params.append(health)
+        
+        rows = [dict(row) for row in conn.execute(query + ' ORDER BY name', params).fetchall()]
+        totals = {}
+        for row in conn.execute('SELECT health, COUNT(*) AS count FROM service_summary GROUP BY health'):
+            totals[row['health']] = row['count']
+        
+        return jsonify({'services': rows, 'health_totals': totals})
+    finally:
+        conn.close()
+
 @app.route('/api/services/<service_id>', methods=['GET'])
 def get_service(service_id):
     """Get detailed information about a specific service"""
     conn = get_db_connection()
     try:
         service = conn.execute('SELECT * FROM services WHERE id = ?', (service_id,)).fetchone()
+        if not service:
+            # Fall back to a unique ID prefix or name
+            match, candidates = resolve_object_id('service', service_id)
+            if candidates:
+                return jsonify({'error': 'Ambiguous service ID prefix', 'candidates': candidates}), 409
+            if match:
+                service_id = match['id']
+                service = conn.execute('SELECT * FROM services WHERE id = ?', (service_id,)).fetchone()
         if not service:
             return jsonify({'error': 'Service not found'}), 404
         
-        # Get containers for this service
-        containers = conn.execute(
-            'SELECT * FROM containers WHERE service_id = ?', (service_id,)
-        ).fetchall()
-        
         result = dict(service)
-        result['containers'] = [dict(container) for container in containers]
+        summary = conn.execute(
+            'SELECT * FROM service_summary WHERE service_id = ?', (service_id,)
+        ).fetchone()
+        result['summary'] = dict(summary) if summary else None
+        
+        # Inline container rows are optional; the summary already carries the counts
+        if request.args.get('containers', 'true').lower() not in ('0', 'false', 'no'):
+            containers = conn.execute(
+                'SELECT * FROM containers WHERE service_id = ?', (service_id,)
+            ).fetchall()
+            result['containers'] = [dict(container) for container in containers]
         return jsonify(result)
     finally:
         conn.close()
@@ -349,6 +2125,14 @@ def get_container(container_id):
     conn = get_db_connection()
     try:
         container = conn.execute('SELECT * FROM containers WHERE id = ?', (container_id,)).fetchone()
+        if not container:
+            # Fall back to a unique ID prefix or name
+            match, candidates = resolve_object_id('container', container_id)
+            if candidates:
+                return jsonify({'error': 'Ambiguous container ID prefix', 'candidates': candidates}), 409
+            if match:
+                container_id = match['id']
+                container = conn.execute('SELECT * FROM containers WHERE id = ?', (container_id,)).fetchone()
         if not container:
             return jsonify({'error': 'Container not found'}), 404
         
@@ -356,6 +2140,121 @@ def get_container(container_id):
     finally:
         conn.close()
 
+@app.route('/api/containers/<container_id>/metrics', methods=['GET'])
+def get_container_metrics(container_id):
+    """Get recent resource usage samples for a container"""
+    with STATS_LOCK:
+        streaming = container_id in STATS_STREAMS
+    if not streaming:
+        # Accept full IDs, unique prefixes and names like /api/containers/<id>; removed
+        # containers are no longer indexed, so their history stays reachable by exact ID
+        match, candidates = resolve_object_id('container', container_id)
+        if candidates:
+            return jsonify({'error': 'Ambiguous container ID prefix', 'candidates': candidates}), 409
+        if match:
+            container_id = match['id']
+    
+    with STATS_LOCK:
+        stream = STATS_STREAMS.get(container_id)
+    
+    if stream:
+        samples = stream.ring.samples(since=request.args.get('since', type=float))
+        return jsonify({
+            'container_id': container_id,
+            'streaming': True,
+            'summary': summarize_samples(samples),
+            'samples': samples
+        })
+    
+    # Not streaming (stopped or over the stream limit): fall back to the last flushed aggregates
+    conn = get_db_connection()
+    try:
+        placeholders = ','.join('?' * len(CONTAINER_RESOURCE_METRICS))
+        rows = conn.execute(
+            f"""SELECT s.metric, r.ts, r.value FROM history_series s 
+                JOIN history_raw r ON r.series_id = s.id 
+                WHERE s.object_type = 'container' AND s.object_id = ? 
+                  AND s.metric IN ({placeholders}) 
+                  AND r.ts = (SELECT MAX(ts) FROM history_raw WHERE series_id = s.id)""",
+            [container_id] + list(CONTAINER_RESOURCE_METRICS)
+        ).fetchall()
+        if not rows:
+            return jsonify({'error': 'No metrics for this container'}), 404
+        
+        return jsonify({
+            'container_id': container_id,
+            'streaming': False,
+            'summary': {row['metric']: row['value'] for row in rows},
+            'as_of': max(row['ts'] for row in rows),
+            'samples': []
+        })
+    finally:
+        conn.close()
+
+@app.route('/api/metrics/top', methods=['GET'])
+def get_top_containers():
+    """Get the containers using the most CPU, memory, network or block I/O.
+    
+    Only containers on the manager's own Docker engine are streamed, so this covers
+    the local node rather than every node in the swarm.
+    """
+    sort_keys = {
+        'cpu': lambda s: s['cpu_percent'],
+        'memory': lambda s: s['mem_bytes'],
+        'network': lambda s: s['net_rx_rate'] + s['net_tx_rate'],
+        'blkio': lambda s: s['blk_read_rate'] + s['blk_write_rate'],
+    }
+    by = request.args.get('by', 'cpu')
+    limit = request.args.get('limit', 10, type=int)
+    if by not in sort_keys:
+        return jsonify({'error': f"by must be one of: {', '.join(sort_keys)}"}), 400
+    
+    with STATS_LOCK:
+        streams = list(STATS_STREAMS.values())
+    
+    summaries = []
+    for stream in streams:
+        summary = summarize_samples(stream.ring.samples())
+        if summary:
+            summary['container_id'] = stream.container_id
+            summaries.append(summary)
+    top = heapq.nlargest(limit, summaries, key=sort_keys[by])
+    
+    # Attach service/node placement from the last collector pass
+    if top:
+        conn = get_db_connection()
+        try:
+            placeholders = ','.join('?' * len(top))
+            rows = conn.execute(
+                f'SELECT id, service_id, node_id, image FROM containers WHERE id IN ({placeholders})',
+                [summary['container_id'] for summary in top]
+            ).fetchall()
+        finally:
+            conn.close()
+        placement = {row['id']: dict(row) for row in rows}
+        for summary in top:
+            info = placement.get(summary['container_id'], {})
+            summary['service_id'] = info.get('service_id')
+            summary['node_id'] = info.get('node_id')
+            summary['image'] = info.get('image')
+    
+    return jsonify({'by': by, 'scope': 'local node', 'containers': top})
+
+@app.route('/api/resolve/<path:value>', methods=['GET'])
+def resolve_id(value):
+    """Resolve an ID prefix or name to a single object, optionally restricted by type"""
+    object_type = request.args.get('type')
+    if object_type and object_type not in ID_INDEX_SOURCES:
+        return jsonify({'error': f"type must be one of: {', '.join(ID_INDEX_SOURCES)}"}), 400
+    
+    match, candidates = resolve_object_id(object_type, value)
+    if candidates:
+        return jsonify({'error': 'Ambiguous prefix', 'candidates': candidates}), 409
+    if not match:
+        return jsonify({'error': 'No matching object'}), 404
+    
+    return jsonify(match)
+
 @app.route('/api/images', methods=['GET'])
 def get_images():
     """Get all images in the registry"""
@@ -398,6 +2297,84 @@ def get_events():
     finally:
         conn.close()
 
+@app.route('/api/history/transitions', methods=['GET'])
+def get_state_transitions():
+    """Get recorded state transitions, with optional filtering"""
+    object_type = request.args.get('object_type')
+    object_id = request.args.get('object_id')
+    since = request.args.get('since', type=int)
+    until = request.args.get('until', type=int)
+    limit = request.args.get('limit', 100, type=int)
+    
+    conn = get_db_connection()
+    try:
+        query = 'SELECT * FROM state_transitions'
+        params = []
+        
+        # Apply filters
+        filters = []
+        if object_type:
+            filters.append('object_type = ?')
+            params.append(object_type)
+        if object_id:
+            filters.append('object_id = ?')
+            params.append(object_id)
+        if since is not None:
+            filters.append('ts >= ?')
+            params.append(since)
+        if until is not None:
+            filters.append('ts <= ?')
+            params.append(until)
+        
+        if filters:
+            query += ' WHERE ' + ' AND '.join(filters)
+        
+        query += ' ORDER BY ts DESC, id DESC LIMIT ?'
+        params.append(limit)
+        
+        transitions = conn.execute(query, params).fetchall()
+        return jsonify([dict(transition) for transition in transitions])
+    finally:
+        conn.close()
+
+@app.route('/api/history/<object_type>/<object_id>', methods=['GET'])
+def get_history(object_type, object_id):
+    """Get a sampled metric for an object over a time range (epoch seconds)"""
+    metric = request.args.get('metric')
+    end = request.args.get('end', int(time.time()), type=int)
+    start = request.args.get('start', end - 3600, type=int)
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+    
+    conn = get_db_connection()
+    try:
+        if not metric:
+            metrics = conn.execute(
+                'SELECT metric FROM history_series WHERE object_type = ? AND object_id = ? ORDER BY metric',
+                (object_type, object_id)
+            ).fetchall()
+            return jsonify({
+                'error': 'metric is required',
+                'available_metrics': [row['metric'] for row in metrics]
+            }), 400
+        
+        series_id = get_series_id(conn, object_type, object_id, metric, create=False)
+        if series_id is None:
+            return jsonify({'error': 'No history for this object and metric'}), 404
+        
+        tier, points = query_history(conn, series_id, start, end)
+        return jsonify({
+            'object_type': object_type,
+            'object_id': object_id,
+            'metric': metric,
+            'start': start,
+            'end': end,
+            'tier': tier,
+            'points': points
+        })
+    finally:
+        conn.close()
+
 @app.route('/api/upload/image', methods=['POST'])
 def upload_image():
     """Upload a docker image tar file and load it into the registry"""
@@ -458,12 +2435,25 @@ def upload_image():
             log_event('upload', 'image', image_info, 
                       f"Image uploaded and pushed to registry as {registry_image}")
             
+            # Optionally warm the image onto nodes before tasks get scheduled there
+            prepull_id = None
+            prepull_error = None
+            prepull_target = request.form.get('prepull')
+            if prepull_target:
+                try:
+                    prepull_id = start_prepull(registry_image, prepull_target,
+                                               request.form.get('prepull_parallel', type=int))
+                except ValueError as e:
+                    prepull_error = str(e)
+            
             # Return success with image info
             return jsonify({
                 'success': True,
                 'message': 'Image uploaded and pushed to registry',
                 'original_image': image_info,
-                'registry_image': registry_image
+                'registry_image': registry_image,
+                'prepull_id': prepull_id,
+                'prepull_error': prepull_error
             })
         
         return jsonify({
@@ -480,6 +2470,48 @@ def upload_image():
         if os.path.exists(filepath):
             os.remove(filepath)
 
+@app.route('/api/prepull', methods=['POST'])
+def create_prepull():
+    """Warm an image onto all nodes, nodes with a label, or the nodes running a service.
+    Nodes this API warmed with the same digest within PREPULL_SKIP_MAX_AGE are skipped."""
+    data = request.get_json(silent=True) or request.form
+    image = data.get('image')
+    if not image:
+        return jsonify({'error': 'Image is required'}), 400
+    
+    try:
+        prepull_id = start_prepull(image, data.get('target', 'all'),
+                                   int(data['max_parallel']) if data.get('max_parallel') else None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'success': True, 'prepull_id': prepull_id}), 202
+
+@app.route('/api/prepull/<prepull_id>', methods=['GET'])
+def get_prepull(prepull_id):
+    """Get per-node progress of an image prepull"""
+    conn = get_db_connection()
+    try:
+        prepull = conn.execute('SELECT * FROM image_prepulls WHERE id = ?', (prepull_id,)).fetchone()
+        if not prepull:
+            return jsonify({'error': 'Prepull not found'}), 404
+        
+        nodes = conn.execute(
+            """SELECT p.node_id, n.hostname, p.status, p.error, p.updated_at 
+               FROM image_prepull_nodes p LEFT JOIN nodes n ON n.id = p.node_id 
+               WHERE p.prepull_id = ? ORDER BY n.hostname""",
+            (prepull_id,)
+        ).fetchall()
+        
+        result = dict(prepull)
+        result['nodes'] = [dict(node) for node in nodes]
+        result['counts'] = {}
+        for node in nodes:
+            result['counts'][node['status']] = result['counts'].get(node['status'], 0) + 1
+        return jsonify(result)
+    finally:
+        conn.close()
+
 @app.route('/api/upload/compose', methods=['POST'])
 def upload_compose():
     """Upload a docker-compose.yml file and deploy it as a stack"""
@@ -489,6 +2521,8 @@ def upload_compose():
     stack_name = request.form.get('stack_name')
     if not stack_name:
         return jsonify({'error': 'Stack name is required'}), 400
+    if not valid_stack_name(stack_name):
+        return jsonify({'error': 'Invalid stack name'}), 400
     
     file = request.files['file']
     if file.filename == '':
@@ -498,27 +2532,26 @@ def upload_compose():
     temp_dir = tempfile.mkdtemp(prefix="compose_", dir=app.config['UPLOAD_FOLDER'])
     compose_path = os.path.join(temp_dir, "docker-compose.yml")
     
+    force = request.form.get('force', 'false').lower() in ('1', 'true', 'yes')
+    
     try:
         # Save uploaded file
         file.save(compose_path)
         
-        # Deploy the stack
-        deploy_result = execute_docker_cmd(f"docker stack deploy -c {compose_path} {stack_name}")
-        if not deploy_result and deploy_result is not None:
-            deploy_result = "Stack deployed successfully"
-        
-        if deploy_result is None:
-            return jsonify({'error': 'Failed to deploy stack'}), 500
-        
-        # Log event
-        log_event('deploy', 'stack', stack_name, 
-                  f"Stack deployed from uploaded compose file")
+        # Deploy the stack, skipping it if nothing changed since the last deploy
+        result = deploy_stack(stack_name, compose_path, force=force, existing_stacks=list_stack_names())
+        if result['status'] == 'failed':
+            return jsonify({'error': result['error'], 'diff': result['diff']}), 500
         
+        unchanged = result['status'] == 'unchanged'
         return jsonify({
             'success': True,
-            'message': 'Stack deployed successfully',
+            'message': 'Stack unchanged, deploy skipped' if unchanged else 'Stack deployed successfully',
             'stack_name': stack_name,
-            'details': deploy_result
+            'skipped': unchanged,
+            'compose_hash': result['compose_hash'],
+            'diff': result.get('diff', {}),
+            'details': result.get('details')
         })
     
     except Exception as e:
@@ -529,6 +2562,60 @@ def upload_compose():
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
 
+@app.route('/api/upload/compose/batch', methods=['POST'])
+def upload_compose_batch():
+    """Upload several compose files (one per form field, named after its stack) and deploy them concurrently"""
+    if not request.files:
+        return jsonify({'error': 'No file part'}), 400
+    
+    invalid = sorted(name for name in request.files if not valid_stack_name(name))
+    if invalid:
+        return jsonify({'error': 'Invalid stack names', 'stack_names': invalid}), 400
+    
+    force = request.form.get('force', 'false').lower() in ('1', 'true', 'yes')
+    max_parallel = request.form.get('max_parallel', DEPLOY_MAX_PARALLEL, type=int)
+    max_parallel = max(1, min(max_parallel, DEPLOY_MAX_PARALLEL))
+    
+    temp_dir = tempfile.mkdtemp(prefix="compose_batch_", dir=app.config['UPLOAD_FOLDER'])
+    try:
+        # Save every compose file first; field names are the stack names
+        compose_paths = {}
+        for stack_name, file in request.files.items():
+            stack_dir = os.path.join(temp_dir, str(len(compose_paths)))
+            os.makedirs(stack_dir)
+            compose_paths[stack_name] = os.path.join(stack_dir, "docker-compose.yml")
+            file.save(compose_paths[stack_name])
+        
+        existing_stacks = list_stack_names()
+        
+        def deploy(stack_name):
+            try:
+                return deploy_stack(stack_name, compose_paths[stack_name], force=force,
+                                    existing_stacks=existing_stacks)
+            except Exception as e:
+                return {'stack_name': stack_name, 'status': 'failed', 'error': str(e)}
+        
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            results = list(executor.map(deploy, compose_paths))
+        
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        
+        return jsonify({
+            'success': counts.get('failed', 0) == 0,
+            'counts': counts,
+            'results': results
+        }), 200 if counts.get('failed', 0) == 0 else 207
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    finally:
+        # Clean up temporary directory
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+
 @app.route('/api/stacks', methods=['GET'])
 def get_stacks():
     """Get all deployed stacks"""
@@ -543,6 +2630,9 @@ def get_stacks():
 @app.route('/api/stacks/<stack_name>', methods=['GET'])
 def get_stack(stack_name):
     """Get detailed information about a specific stack"""
+    if not valid_stack_name(stack_name):
+        return jsonify({'error': 'Invalid stack name'}), 400
+    
     # Get stack services
     services_output = execute_docker_cmd(f"docker stack services {stack_name} --format '{{json .}}'")
     if not services_output:
@@ -559,10 +2649,21 @@ def get_stack(stack_name):
 @app.route('/api/stacks/<stack_name>', methods=['DELETE'])
 def remove_stack(stack_name):
     """Remove a deployed stack"""
-    result = execute_docker_cmd(f"docker stack rm {stack_name}")
+    if not valid_stack_name(stack_name):
+        return jsonify({'error': 'Invalid stack name'}), 400
+    
+    result = execute_docker_cmd(f"docker stack rm {shlex.quote(stack_name)}")
     if result is None:
         return jsonify({'error': 'Failed to remove stack'}), 500
     
+    # Forget the deploy hash so the next upload of this stack actually deploys
+    conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM stack_deployments WHERE stack_name = ?', (stack_name,))
+        conn.commit()
+    finally:
+        conn.close()
+    
     # Log event
     log_event('remove', 'stack', stack_name, 'Stack removed')
     
@@ -609,6 +2710,46 @@ def get_registry_images():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/registry/metrics', methods=['GET'])
+def get_registry_metrics():
+    """Get derived registry metrics: latest values, or one series over a time range"""
+    series = request.args.get('series')
+    name_filter = request.args.get('filter')
+    
+    if not series:
+        with REGISTRY_LOCK:
+            as_of = REGISTRY_SCRAPE['ts']
+            latest = REGISTRY_SCRAPE['latest']
+        if name_filter:
+            latest = {name: values for name, values in latest.items() if name_filter in name}
+        return jsonify({
+            'as_of': int(as_of) if as_of else None,
+            'source': REGISTRY_METRICS_URL,
+            'series': latest
+        })
+    
+    metric = request.args.get('metric', 'rate')
+    end = request.args.get('end', int(time.time()), type=int)
+    start = request.args.get('start', end - 3600, type=int)
+    
+    conn = get_db_connection()
+    try:
+        series_id = get_series_id(conn, 'registry', series, metric, create=False)
+        if series_id is None:
+            return jsonify({'error': 'No history for this series and metric'}), 404
+        
+        tier, points = query_history(conn, series_id, start, end)
+        return jsonify({
+            'series': series,
+            'metric': metric,
+            'start': start,
+            'end': end,
+            'tier': tier,
+            'points': points
+        })
+    finally:
+        conn.close()
+
 @app.route('/api/registry/<path:repo>/tags/<tag>', methods=['DELETE'])
 def delete_registry_image(repo, tag):
     """Delete an image from the registry"""
@@ -636,6 +2777,71 @@ def delete_registry_image(repo, tag):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/gluster/bricks', methods=['GET'])
+def get_gluster_bricks():
+    """Get status and capacity of every brick in the GlusterFS volume"""
+    conn = get_db_connection()
+    try:
+        bricks = conn.execute('SELECT * FROM gluster_bricks ORDER BY brick').fetchall()
+        return jsonify({
+            'volume': GLUSTER_VOLUME_NAME,
+            'bricks': [dict(brick) for brick in bricks]
+        })
+    finally:
+        conn.close()
+
+@app.route('/api/gluster/profile', methods=['GET'])
+def get_gluster_profile():
+    """Get per-brick FOP latencies and throughput from the latest profile interval"""
+    if not GLUSTER_PROFILE:
+        return jsonify({'error': 'GlusterFS profiling is disabled (GLUSTER_PROFILE=false)'}), 404
+    
+    brick = request.args.get('brick')
+    with GLUSTER_LOCK:
+        as_of = GLUSTER_STATE['profile_as_of']
+        profile = GLUSTER_STATE['profile']
+    if brick:
+        profile = {name: stats for name, stats in profile.items() if name == brick}
+    
+    return jsonify({'volume': GLUSTER_VOLUME_NAME, 'as_of': as_of, 'bricks': profile})
+
+@app.route('/api/gluster/top', methods=['GET'])
+def get_gluster_top():
+    """Get the hottest files per brick for read, write and open operations"""
+    with GLUSTER_LOCK:
+        as_of = GLUSTER_STATE['top_as_of']
+        top = GLUSTER_STATE['top']
+    
+    return jsonify({'volume': GLUSTER_VOLUME_NAME, 'as_of': as_of, 'bricks': top})
+
+@app.route('/api/gluster/history', methods=['GET'])
+def get_gluster_history():
+    """Get a brick metric (e.g. used_percent, read_bytes_rate, fop.WRITE.avg_latency_us) over a time range"""
+    brick = request.args.get('brick')
+    metric = request.args.get('metric')
+    if not brick or not metric:
+        return jsonify({'error': 'brick and metric are required'}), 400
+    end = request.args.get('end', int(time.time()), type=int)
+    start = request.args.get('start', end - 3600, type=int)
+    
+    conn = get_db_connection()
+    try:
+        series_id = get_series_id(conn, 'gluster_brick', brick, metric, create=False)
+        if series_id is None:
+            return jsonify({'error': 'No history for this brick and metric'}), 404
+        
+        tier, points = query_history(conn, series_id, start, end)
+        return jsonify({
+            'brick': brick,
+            'metric': metric,
+            'start': start,
+            'end': end,
+            'tier': tier,
+            'points': points
+        })
+    finally:
+        conn.close()
+
 @app.route('/api/stats', methods=['GET'])
 def get_system_stats():
     """Get system-wide statistics"""
@@ -677,10 +2883,9 @@ def get_system_stats():
 def refresh_data():
     """Manually trigger a refresh of the database"""
     try:
-        update_nodes()
-        update_services()
-        update_containers()
-        update_images()
+        for resource in SYNC_RESOURCES:
+            sync_resource(resource, full=True)
+        sync_stats_streams()
         
         return jsonify({
             'success': True,
@@ -695,12 +2900,28 @@ def start_worker():
     worker_thread = threading.Thread(target=update_data_worker)
     worker_thread.daemon = True
     worker_thread.start()
+    
+    metrics_thread = threading.Thread(target=metrics_flush_worker)
+    metrics_thread.daemon = True
+    metrics_thread.start()
+    
+    registry_thread = threading.Thread(target=registry_metrics_worker)
+    registry_thread.daemon = True
+    registry_thread.start()
+    
+    gluster_thread = threading.Thread(target=gluster_worker)
+    gluster_thread.daemon = True
+    gluster_thread.start()
+    
+    probe_thread = threading.Thread(target=startup_probe)
+    probe_thread.daemon = True
+    probe_thread.start()
 
 if __name__ == '__main__':
     # Initialize the database connection
-    print("Initializing database connection...")
-    conn = get_db_connection()
-    conn.close()
+    print("Initializing database...")
+    init_db()
+    load_sync_state()
     
     # Start the background worker
     print("Starting background data update worker...")